@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import io
+import sys
+import json
+import time
+import tracemalloc
+
+from track_record import TrackRecord, iter_records, write_records
+
+DEFAULT_COUNT = 10000
+PAGE_SIZE = 200
+
+
+def fake_soundcloud_track(i):
+    """A track shaped like a /resolve playlist entry, with the usual nested user object"""
+    return {
+        'kind': 'track', 'id': 1000000 + i, 'urn': f'soundcloud:tracks:{1000000 + i}',
+        'title': f'Track Title Number {i} (Extended Mix)', 'permalink': f'track-title-number-{i}',
+        'permalink_url': f'https://soundcloud.com/artist-{i % 500}/track-title-number-{i}',
+        'uri': f'https://api.soundcloud.com/tracks/{1000000 + i}',
+        'artwork_url': f'https://i1.sndcdn.com/artworks-{i:012d}-abcdef-large.jpg',
+        'waveform_url': f'https://wave.sndcdn.com/{i:012d}_m.png',
+        'stream_url': f'https://api.soundcloud.com/tracks/{1000000 + i}/stream',
+        'download_url': None, 'description': 'Out now on all platforms. ' * 8,
+        'genre': 'Techno', 'tag_list': 'techno "hard techno" rave warehouse', 'label_name': 'Some Label',
+        'created_at': '2024/01/01 12:00:00 +0000', 'last_modified': '2024/01/02 12:00:00 +0000',
+        'duration': 300000 + i, 'bpm': None, 'key_signature': None, 'isrc': None, 'release': None,
+        'streamable': True, 'downloadable': False, 'sharing': 'public', 'license': 'all-rights-reserved',
+        'playback_count': 12345 + i, 'favoritings_count': 321, 'reposts_count': 45, 'comment_count': 6,
+        'access': 'playable', 'embeddable_by': 'all', 'state': 'finished', 'policy': 'ALLOW',
+        'user': {
+            'kind': 'user', 'id': 2000000 + i % 500, 'urn': f'soundcloud:users:{2000000 + i % 500}',
+            'username': f'Artist {i % 500}', 'permalink': f'artist-{i % 500}',
+            'permalink_url': f'https://soundcloud.com/artist-{i % 500}',
+            'avatar_url': f'https://i1.sndcdn.com/avatars-{i:012d}-large.jpg',
+            'full_name': f'Artist Full Name {i % 500}', 'city': 'Berlin', 'country': 'Germany',
+            'description': 'DJ and producer. Bookings: someone@example.com ' * 3,
+            'followers_count': 10000, 'followings_count': 500, 'track_count': 120,
+            'playlist_count': 10, 'public_favorites_count': 800, 'reposts_count': 40,
+            'plan': 'Pro Unlimited', 'website': 'https://example.com', 'website_title': 'Website',
+            'created_at': '2012/01/01 12:00:00 +0000', 'last_modified': '2024/01/01 12:00:00 +0000',
+        },
+    }
+
+
+def measure(build):
+    """Traced memory in bytes still held by what build() returns, and the peak while building it"""
+    tracemalloc.start()
+    held = build()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size, peak
+
+
+def convert_at_end(pages):
+    """How the fetchers used to work: collect every page's payloads, convert once done"""
+    tracks = []
+    for body in pages:
+        tracks.extend(json.loads(body)['collection'])
+    return [TrackRecord.from_soundcloud(track) for track in tracks if track.get('streamable')]
+
+
+def convert_per_page(pages):
+    """How the fetchers work now: convert each page as it arrives and drop its payloads"""
+    records = []
+    for body in pages:
+        page = json.loads(body)
+        records.extend(TrackRecord.from_soundcloud(track) for track in page['collection'] if track.get('streamable'))
+    return records
+
+
+def timed(func, repeat=3):
+    """Best of repeat runs, in seconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT
+
+    # Parsed from JSON like the real API response, so strings aren't shared
+    payload = json.dumps([fake_soundcloud_track(i) for i in range(count)])
+
+    payload_bytes = measure(lambda: json.loads(payload))[0]
+    tracks = json.loads(payload)
+    record_bytes = measure(lambda: [TrackRecord.from_soundcloud(track) for track in tracks])[0]
+    dict_bytes = measure(lambda: [TrackRecord.from_soundcloud(track).to_dict() for track in tracks])[0]
+
+    print(f"Memory for {count} tracks:")
+    print(f"  full API payloads   {payload_bytes / 1024 / 1024:8.2f} MB")
+    print(f"  trimmed dicts       {dict_bytes / 1024 / 1024:8.2f} MB")
+    print(f"  TrackRecord         {record_bytes / 1024 / 1024:8.2f} MB  "
+          f"({payload_bytes / record_bytes:.1f}x smaller than payloads)")
+
+    # Peak while fetching a playlist of count tracks in API pages, the raw
+    # response bodies stand in for the network and are not counted
+    pages = [json.dumps({'collection': tracks[start:start + PAGE_SIZE]})
+             for start in range(0, count, PAGE_SIZE)]
+    end_peak = measure(lambda: convert_at_end(pages))[1]
+    page_peak = measure(lambda: convert_per_page(pages))[1]
+
+    print(f"Peak memory fetching {count} tracks in pages of {PAGE_SIZE}:")
+    print(f"  convert at end      {end_peak / 1024 / 1024:8.2f} MB")
+    print(f"  convert per page    {page_peak / 1024 / 1024:8.2f} MB  "
+          f"({end_peak / page_peak:.1f}x lower peak)")
+
+    records = [TrackRecord.from_soundcloud(track) for track in tracks]
+    full_lines = '\n'.join(json.dumps(track) for track in tracks)
+
+    def handoff_full():
+        # What passing whole API payloads between stages would cost
+        out = '\n'.join(json.dumps(track) for track in tracks)
+        return [json.loads(line) for line in out.splitlines()]
+
+    def handoff_records():
+        out = io.StringIO()
+        write_records(records, out)
+        out.seek(0)
+        return list(iter_records(out))
+
+    full_time = timed(handoff_full)
+    record_time = timed(handoff_records)
+
+    print(f"Stage hand-off (serialise + parse) for {count} tracks:")
+    print(f"  full API payloads   {full_time * 1000:8.1f} ms  {len(full_lines) / 1024 / 1024:6.2f} MB of JSON")
+    print(f"  TrackRecord JSONL   {record_time * 1000:8.1f} ms  "
+          f"{sum(len(r.to_json()) + 1 for r in records) / 1024 / 1024:6.2f} MB of JSON")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+# Shared between all rippy processes (and containers, via a mounted volume)
+# that should count against the same memory budget
+GOVERNOR_DIR = os.environ.get('RIPPY_GOVERNOR_DIR', '/tmp/rippy_governor')
+
+# Total memory (PSS) all headless browsers may use together, 0 disables the budget
+BUDGET_MB = int(os.environ.get('RIPPY_BROWSER_BUDGET_MB', '0'))
+
+# A driver whose process tree grows past this is restarted
+RECYCLE_MB = int(os.environ.get('RIPPY_BROWSER_RECYCLE_MB', '800'))
+
+# Reserved for a browser that has not reported a measurement yet
+ESTIMATE_MB = int(os.environ.get('RIPPY_BROWSER_ESTIMATE_MB', '400'))
+
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 60
+WAIT_SECONDS = 5
+
+
+def read_rss_kb(pid):
+    """Resident set size of a single process in kB, 0 if it is gone"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def read_pss_kb(pid):
+    """Proportional set size of a single process in kB, 0 if it is gone
+
+    Chrome's processes share most of their pages, so summing RSS over the
+    tree counts the same memory several times. PSS splits shared pages
+    between the processes mapping them. Falls back to RSS on kernels
+    without smaps_rollup.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        return read_rss_kb(pid)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def get_children_map():
+    """Map of parent pid -> child pids for every process in /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, fields resume after the last ')'
+        fields = stat[stat.rfind(')') + 2:].split()
+        ppid = int(fields[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def process_tree_pss_mb(root_pids):
+    """Combined PSS in MB of the given processes and all their descendants"""
+    if not os.path.isdir('/proc'):
+        return 0
+
+    children = get_children_map()
+    seen = set()
+    stack = [pid for pid in root_pids if pid]
+
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        stack.extend(children.get(pid, []))
+
+    return sum(read_pss_kb(pid) for pid in seen) // 1024
+
+
+def driver_root_pids(driver):
+    """PIDs of chromedriver and the Chrome it launched"""
+    pids = []
+
+    service = getattr(driver, 'service', None)
+    process = getattr(service, 'process', None)
+    if process is not None:
+        pids.append(process.pid)
+
+    # undetected_chromedriver starts Chrome itself rather than via chromedriver
+    browser_pid = getattr(driver, 'browser_pid', None)
+    if browser_pid:
+        pids.append(browser_pid)
+
+    return pids
+
+
+class BrowserSlot:
+    """A place in the shared browser memory budget, holding one driver
+
+    acquire() blocks until the budget has room, then starts a driver with
+    the given factory. While held, a heartbeat thread publishes the driver's
+    measured process-tree PSS so other processes see the real usage.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.driver = None
+        self.slot_file = os.path.join(GOVERNOR_DIR, f"{socket.gethostname()}-{os.getpid()}.json")
+        self.lock_file = os.path.join(GOVERNOR_DIR, '.lock')
+        self.mem_mb = 0
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _locked(self):
+        os.makedirs(GOVERNOR_DIR, exist_ok=True)
+        handle = open(self.lock_file, 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _other_slots_mb(self):
+        """Memory claimed by other live slots, dropping ones that stopped reporting"""
+        total = 0
+        now = time.time()
+
+        for name in os.listdir(GOVERNOR_DIR):
+            path = os.path.join(GOVERNOR_DIR, name)
+            if not name.endswith('.json') or path == self.slot_file:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    slot = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            if now - slot.get('heartbeat', 0) > STALE_SECONDS:
+                logging.info(f"Dropping stale browser slot: {name}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+
+            # Chrome is small right after launch, never count less than the estimate
+            total += max(slot.get('mem_mb', 0), ESTIMATE_MB)
+        return total
+
+    def _write_slot(self):
+        slot = {'mem_mb': self.mem_mb, 'heartbeat': time.time()}
+        tmp_file = self.slot_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(slot, f)
+        os.replace(tmp_file, self.slot_file)
+
+    def _reserve(self):
+        """Wait until the budget can fit another browser, then claim it"""
+        waiting = False
+
+        while True:
+            with self._locked():
+                in_use = self._other_slots_mb()
+                # A single browser is always allowed so a tiny budget can't deadlock
+                if BUDGET_MB <= 0 or in_use == 0 or in_use + ESTIMATE_MB <= BUDGET_MB:
+                    self.mem_mb = ESTIMATE_MB
+                    self._write_slot()
+                    return
+
+            if not waiting:
+                logging.info(f"Browser budget full ({in_use}/{BUDGET_MB} MB), waiting for a slot...")
+                waiting = True
+            time.sleep(WAIT_SECONDS)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            self.measure()
+            try:
+                self._write_slot()
+            except OSError as e:
+                logging.warning(f"Failed to update browser slot: {e}")
+
+    def measure(self):
+        """Refresh and return the driver's process-tree PSS in MB"""
+        if self.driver is not None:
+            self.mem_mb = process_tree_pss_mb(driver_root_pids(self.driver))
+        return self.mem_mb
+
+    def acquire(self):
+        """Block until the budget allows a browser, then start and return it"""
+        self._reserve()
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+
+        try:
+            self.driver = self.factory()
+        except Exception:
+            self.release()
+            raise
+
+        logging.info(f"Browser started using {self.measure()} MB")
+        self._write_slot()
+        return self.driver
+
+    def maybe_recycle(self):
+        """Restart the driver if it has grown past the recycle threshold"""
+        if self.driver is None or RECYCLE_MB <= 0:
+            return self.driver
+
+        mem_mb = self.measure()
+        if mem_mb <= RECYCLE_MB:
+            return self.driver
+
+        logging.info(f"Browser using {mem_mb} MB (limit {RECYCLE_MB} MB), recycling driver")
+        self._quit_driver()
+        self.driver = self.factory()
+        return self.driver
+
+    def _quit_driver(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logging.warning(f"Failed to quit driver: {e}")
+            self.driver = None
+
+    def release(self):
+        """Quit the driver and hand its share of the budget back"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+        self._quit_driver()
+
+        with self._locked():
+            try:
+                os.remove(self.slot_file)
+            except OSError:
+                pass
+
+
+def show_status():
+    """Print the browsers currently counted against the budget"""
+    if not os.path.isdir(GOVERNOR_DIR):
+        print("No browsers running")
+        return 0
+
+    total = 0
+    now = time.time()
+    for name in sorted(os.listdir(GOVERNOR_DIR)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(GOVERNOR_DIR, name), 'r') as f:
+                slot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        age = int(now - slot.get('heartbeat', 0))
+        state = 'stale' if age > STALE_SECONDS else 'live'
+        print(f"{name[:-5]:<40} {slot.get('mem_mb', 0):>6} MB  {state} ({age}s ago)")
+        if state == 'live':
+            total += slot.get('mem_mb', 0)
+
+    budget = f"{BUDGET_MB} MB" if BUDGET_MB > 0 else "unlimited"
+    print(f"Total: {total} MB of {budget}")
+    return 0
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'status':
+        print(f"Usage: {sys.argv[0]} status", file=sys.stderr)
+        return 1
+    return show_status()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
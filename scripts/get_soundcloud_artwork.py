@@ -6,6 +6,7 @@ import json
 import requests
 import time
 from urllib.parse import urlparse
+from track_record import soundcloud_artwork_url
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(SCRIPT_DIR)
@@ -58,13 +59,7 @@ def get_soundcloud_track_artwork(track_url):
     if track_data.get('kind') != 'track':
         return None
 
-    artwork_url = track_data.get('artwork_url')
-    if artwork_url:
-        # Replace with highest quality version
-        artwork_url = artwork_url.replace('large', 't500x500')
-        return artwork_url
-
-    return None
+    return soundcloud_artwork_url(track_data)
 
 def main():
     if len(sys.argv) < 2:
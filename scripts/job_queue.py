@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+# Stages a job moves through, in order. A job is resumed at its recorded stage:
+#   queued     - nothing done yet, needs browser resolution
+#   resolving  - claimed by the process resolving it (downloader or prefetch.py),
+#                others wait instead of starting a second lucida job
+#   resolved   - service URL known, needs initiate_download()
+#   handoff    - lucida job running server-side, keep polling
+#   completed  - lucida finished converting, needs download_file()
+#   downloaded - file on disk, needs transcoding
+#   done       - transcoded, nothing left to do
+#   failed     - out of attempts, tried again once next_attempt_at has passed
+#   unavailable - lucida says the service doesn't have the track, rechecked later
+STAGES = ['queued', 'resolving', 'resolved', 'handoff', 'completed', 'downloaded', 'done',
+          'failed', 'unavailable']
+ACTIVE_STAGES = ['queued', 'resolving', 'resolved', 'handoff', 'completed', 'downloaded']
+RESUMABLE_STAGES = ['handoff', 'completed', 'downloaded']
+# Stages where lucida_browser.py must be handed the job rather than a new
+# lucida job started; apart from waiting on a claim it won't need a browser
+CONTINUABLE_STAGES = ['resolving', 'resolved'] + RESUMABLE_STAGES
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Jobs the downloader started itself are resumed before prefetched ones, it
+# was working on them when the previous run stopped
+DOWNLOADER_PRIORITY = 1
+
+# Seconds to wait before the next attempt, doubled for every failed attempt
+RETRY_BACKOFF = 60
+# Seconds a job out of attempts rests before it gets a fresh set, so an outage
+# of lucida or a service doesn't park tracks for good
+FAILED_COOLDOWN = 3600
+# Seconds before a service that didn't have a track is asked again
+UNAVAILABLE_RECHECK = 86400
+# Seconds after which a resolving claim is considered abandoned. Resolving
+# takes about a minute at most
+CLAIM_TIMEOUT = 180
+CLAIM_POLL_SECONDS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    service TEXT NOT NULL,
+    artist TEXT,
+    title TEXT,
+    output_dir TEXT,
+    stage TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_attempt_at INTEGER NOT NULL DEFAULT 0,
+    service_url TEXT,
+    request_id TEXT,
+    server_name TEXT,
+    path TEXT,
+    error TEXT,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    UNIQUE (url, service)
+);
+"""
+
+
+class JobQueue:
+    """Durable per-track job queue backed by SQLite in WAL mode"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+        # Databases created by older versions lack some columns
+        columns = [row['name'] for row in self.conn.execute('PRAGMA table_info(jobs)')]
+        if 'next_attempt_at' not in columns:
+            self.conn.execute('ALTER TABLE jobs ADD COLUMN next_attempt_at INTEGER NOT NULL DEFAULT 0')
+        if 'priority' not in columns:
+            self.conn.execute('ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_stage_priority ON jobs (stage, priority DESC, id)')
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, url, service):
+        """Return the job for url/service as a dict, or None"""
+        row = self.conn.execute(
+            'SELECT * FROM jobs WHERE url = ? AND service = ?', (url, service)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def enqueue(self, url, service, artist=None, title=None, output_dir=None,
+                priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Add a job, or refresh metadata and priority of an existing one
+
+        Failed and unavailable jobs whose wait is over are rewound to queued
+        with a fresh set of attempts, as are active jobs left out of attempts.
+        """
+        now = int(time.time())
+        self.conn.execute(
+            """
+            INSERT INTO jobs (url, service, artist, title, output_dir, priority,
+                              max_attempts, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (url, service) DO UPDATE SET
+                artist = COALESCE(excluded.artist, artist),
+                title = COALESCE(excluded.title, title),
+                output_dir = COALESCE(excluded.output_dir, output_dir),
+                priority = MAX(priority, excluded.priority),
+                updated_at = excluded.updated_at
+            """,
+            (url, service, artist, title, output_dir, priority, max_attempts, now, now)
+        )
+        self.conn.execute(
+            """
+            UPDATE jobs SET stage = 'queued', attempts = 0, updated_at = ?
+            WHERE url = ? AND service = ? AND stage IN ('failed', 'unavailable')
+                  AND next_attempt_at <= ?
+            """,
+            (now, url, service, now)
+        )
+        active = ', '.join(f"'{stage}'" for stage in ACTIVE_STAGES)
+        self.conn.execute(
+            f"""
+            UPDATE jobs SET attempts = 0, updated_at = ?
+            WHERE url = ? AND service = ? AND stage IN ({active})
+                  AND attempts >= max_attempts
+            """,
+            (now, url, service)
+        )
+        return self.get(url, service)
+
+    def set_stage(self, url, service, stage, **fields):
+        """Move a job to a new stage, storing any extra columns passed in"""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+
+        columns = ['stage = ?', 'updated_at = ?']
+        values = [stage, int(time.time())]
+        for key, value in fields.items():
+            columns.append(f"{key} = ?")
+            values.append(value)
+        values.extend([url, service])
+
+        self.conn.execute(
+            f"UPDATE jobs SET {', '.join(columns)} WHERE url = ? AND service = ?",
+            values
+        )
+
+    def claim(self, url, service):
+        """Take a queued job for resolving, counting an attempt. Returns False if
+        another process got there first or the job is backing off"""
+        now = int(time.time())
+        cursor = self.conn.execute(
+            """
+            UPDATE jobs SET stage = 'resolving', attempts = attempts + 1, updated_at = ?
+            WHERE url = ? AND service = ? AND stage = 'queued'
+                  AND attempts < max_attempts AND next_attempt_at <= ?
+            """,
+            (now, url, service, now)
+        )
+        return cursor.rowcount == 1
+
+    def unclaim(self, url, service):
+        """Hand a claimed job back to the queue untouched"""
+        self.conn.execute(
+            "UPDATE jobs SET stage = 'queued', updated_at = ? "
+            "WHERE url = ? AND service = ? AND stage = 'resolving'",
+            (int(time.time()), url, service)
+        )
+
+    def wait_for_claim(self, url, service, timeout=CLAIM_TIMEOUT):
+        """Wait until whoever claimed a job is done resolving it, taking over abandoned claims"""
+        while True:
+            job = self.get(url, service)
+            if not job or job['stage'] != 'resolving':
+                return job
+
+            if time.time() - job['updated_at'] > timeout:
+                logging.warning(f"Resolving claim on {url} ({service}) went stale, taking over")
+                self.unclaim(url, service)
+                return self.get(url, service)
+
+            time.sleep(CLAIM_POLL_SECONDS)
+
+    def retry_now(self, url, service):
+        """Clear the backoff of a queued job, for a retry the caller schedules itself"""
+        self.conn.execute(
+            "UPDATE jobs SET next_attempt_at = 0, updated_at = ? "
+            "WHERE url = ? AND service = ? AND stage = 'queued'",
+            (int(time.time()), url, service)
+        )
+
+    def fail(self, url, service, error):
+        """Record a failed attempt, rewinding the job so it is retried after a backoff"""
+        job = self.get(url, service)
+        if not job:
+            return
+
+        now = int(time.time())
+        if job['attempts'] >= job['max_attempts']:
+            logging.warning(f"Job {url} ({service}) exhausted {job['max_attempts']} attempts, "
+                            f"retrying in {FAILED_COOLDOWN}s")
+            self.set_stage(url, service, 'failed', error=error,
+                           next_attempt_at=now + FAILED_COOLDOWN)
+        else:
+            # Handoffs are not reusable after an error, start over from the top
+            backoff = RETRY_BACKOFF * 2 ** max(job['attempts'] - 1, 0)
+            self.set_stage(url, service, 'queued', error=error,
+                           request_id=None, server_name=None,
+                           next_attempt_at=now + backoff)
+
+    def unavailable(self, url, service):
+        """Record that a service doesn't have the track. Not a failed attempt"""
+        self.set_stage(url, service, 'unavailable', error='not available', attempts=0,
+                       service_url=None, request_id=None, server_name=None,
+                       next_attempt_at=int(time.time()) + UNAVAILABLE_RECHECK)
+
+    def finish(self, url):
+        """Mark every job for a track URL as done"""
+        self.conn.execute(
+            """
+            UPDATE jobs SET stage = 'done', updated_at = ?
+            WHERE url = ? AND stage NOT IN ('failed', 'unavailable')
+            """,
+            (int(time.time()), url)
+        )
+
+    def reset(self, url):
+        """Clear attempts and failures for a track URL so it is tried again"""
+        self.conn.execute(
+            """
+            UPDATE jobs SET stage = 'queued', attempts = 0, next_attempt_at = 0, error = NULL,
+                            request_id = NULL, server_name = NULL, updated_at = ?
+            WHERE url = ?
+            """,
+            (int(time.time()), url)
+        )
+
+    def expire_handoffs(self, max_age):
+        """Rewind handoffs nobody picked up within max_age seconds, lucida drops them eventually
+
+        The attempt that started the handoff didn't fail, so it is given back.
+        """
+        cutoff = int(time.time()) - max_age
+        cursor = self.conn.execute(
+            """
+            UPDATE jobs SET stage = 'queued', attempts = MAX(attempts - 1, 0),
+                            request_id = NULL, server_name = NULL, updated_at = ?
+            WHERE stage IN ('handoff', 'completed') AND updated_at < ?
+            """,
+            (int(time.time()), cutoff)
+        )
+        return cursor.rowcount
+
+    def pending(self, stages=None, limit=None):
+        """Return active jobs, highest priority first
+
+        Out of attempts only matters for jobs that still have to be started,
+        a job past that point is always finished.
+        """
+        stages = stages or ACTIVE_STAGES
+        placeholders = ', '.join('?' for _ in stages)
+        query = (f"SELECT * FROM jobs WHERE stage IN ({placeholders}) "
+                 f"AND (stage != 'queued' OR attempts < max_attempts) "
+                 f"ORDER BY priority DESC, id")
+        params = list(stages)
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return [dict(row) for row in self.conn.execute(query, params)]
+
+
+def default_db_path():
+    """Queue location from RIPPY_QUEUE_DB, or None when the queue is disabled"""
+    return os.environ.get('RIPPY_QUEUE_DB') or None
+
+
+# Columns rip.sh may set along with a stage
+STAGE_FIELDS = ['service_url', 'request_id', 'server_name', 'path']
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage:", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> add <url> <service> <artist> <title> <output_dir> [priority]", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> has <url> <service>   - Exit 0 if a job is prefetched or in flight", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> claim <url> <service> <artist> <title> <output_dir>", file=sys.stderr)
+        print(f"                                           - Exit 0 if the job was taken for resolving", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> unclaim <url> <service>", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> stage <url> <service> <stage> [column=value ...]", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> fail <url> <service> <error>", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> unavailable <url> <service>", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> retry <url> <service> - Allow the next attempt right away", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> finish <url>          - Mark track as transcoded", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> reset <url>           - Clear failures for track", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> resume                - Finish in-flight handoffs", file=sys.stderr)
+        print(f"  {sys.argv[0]} <db> list                  - Show active jobs", file=sys.stderr)
+        return 1
+
+    queue = JobQueue(sys.argv[1])
+    command = sys.argv[2]
+    args = sys.argv[3:]
+
+    try:
+        if command == 'add' and len(args) >= 5:
+            priority = int(args[5]) if len(args) > 5 else 0
+            queue.enqueue(args[0], args[1], args[2], args[3], args[4], priority=priority)
+            return 0
+
+        if command == 'has' and len(args) >= 2:
+            job = queue.get(args[0], args[1])
+            return 0 if job and job['stage'] in CONTINUABLE_STAGES else 1
+
+        if command == 'claim' and len(args) >= 5:
+            queue.enqueue(args[0], args[1], args[2], args[3], args[4], priority=DOWNLOADER_PRIORITY)
+            return 0 if queue.claim(args[0], args[1]) else 1
+
+        if command == 'unclaim' and len(args) >= 2:
+            queue.unclaim(args[0], args[1])
+            return 0
+
+        if command == 'stage' and len(args) >= 3:
+            fields = dict(arg.split('=', 1) for arg in args[3:])
+            unknown = [key for key in fields if key not in STAGE_FIELDS]
+            if unknown:
+                print(f"ERROR: Unknown columns: {', '.join(unknown)}", file=sys.stderr)
+                return 1
+            queue.set_stage(args[0], args[1], args[2], **fields)
+            return 0
+
+        if command == 'fail' and len(args) >= 3:
+            queue.fail(args[0], args[1], args[2])
+            return 0
+
+        if command == 'unavailable' and len(args) >= 2:
+            queue.unavailable(args[0], args[1])
+            return 0
+
+        if command == 'retry' and len(args) >= 2:
+            queue.retry_now(args[0], args[1])
+            return 0
+
+        if command == 'finish' and args:
+            queue.finish(args[0])
+            return 0
+
+        if command == 'reset' and args:
+            queue.reset(args[0])
+            return 0
+
+        if command == 'resume':
+            # Imported here so the queue itself has no selenium dependency
+            from lucida_browser import resume_all
+            return resume_all(queue)
+
+        if command == 'list':
+            for job in queue.pending():
+                print(f"{job['stage']:<10} p={job['priority']} a={job['attempts']}/{job['max_attempts']} "
+                      f"{job['service']:<10} {job['artist']} - {job['title']}")
+            return 0
+
+        print(f"ERROR: Unknown command or missing arguments: {command}", file=sys.stderr)
+        return 1
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,10 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium_stealth import stealth
 import requests
 import logging
+from browser_governor import BrowserSlot
+from job_queue import JobQueue, DOWNLOADER_PRIORITY, RESUMABLE_STAGES, default_db_path
+from soundcloud_download import download_track
+from track_record import TrackRecord
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
@@ -206,6 +210,51 @@ def download_file(request_id, server_name, output_path):
     logging.info(f"Successfully downloaded to {output_path}")
     return True
 
+def build_output_path(output_dir, artist, title, service):
+    safe_artist = artist.replace('/', '_')
+    safe_title = title.replace('/', '_')
+    extension = "mp3" if service == "soundcloud" else "flac"
+    return f"{output_dir}/{safe_artist} - {safe_title}.{extension}"
+
+def resume_job(queue, job):
+    """Drive a job that already has a lucida handoff to a downloaded file
+
+    The attempt that started the handoff was counted then, resuming it is
+    not another one.
+    """
+    url, service = job['url'], job['service']
+
+    if job['stage'] == 'handoff':
+        logging.info(f"Resuming poll for {job['artist']} - {job['title']} ({service})")
+        if not poll_status(job['request_id'], job['server_name']):
+            queue.fail(url, service, 'poll failed')
+            return None
+        queue.set_stage(url, service, 'completed')
+        job = queue.get(url, service)
+
+    if job['stage'] == 'completed':
+        output_path = build_output_path(job['output_dir'], job['artist'], job['title'], service)
+        logging.info(f"Resuming download for {job['artist']} - {job['title']} ({service})")
+        if not download_file(job['request_id'], job['server_name'], output_path):
+            queue.fail(url, service, 'download failed')
+            return None
+        queue.set_stage(url, service, 'downloaded', path=output_path)
+        job = queue.get(url, service)
+
+    if job['stage'] == 'downloaded' and job['path'] and os.path.exists(job['path']):
+        return job
+
+    return None
+
+def resume_all(queue):
+    """Finish every in-flight handoff left behind by a previous run"""
+    resumed = 0
+    for job in queue.pending(stages=['handoff', 'completed']):
+        if resume_job(queue, job):
+            resumed += 1
+    logging.info(f"Resumed {resumed} in-flight jobs")
+    return 0
+
 def main():
     if len(sys.argv) < 5:
         print("Usage: lucida_browser.py <spotify_url> <service> <artist> <title> <output_dir>", file=sys.stderr)
@@ -217,43 +266,128 @@ def main():
     title = sys.argv[4]
     output_dir = sys.argv[5] if len(sys.argv) > 5 else "."
 
-    driver = None
+    queue = None
+    db_path = default_db_path()
+    if db_path:
+        queue = JobQueue(db_path)
+
+    slot = None
     try:
-        driver = setup_driver()
+        service_url = None
+
+        if queue:
+            job = queue.enqueue(spotify_url, service, artist, title, output_dir,
+                                priority=DOWNLOADER_PRIORITY)
+
+            stale_download = job['stage'] == 'downloaded' and not (job['path'] and os.path.exists(job['path']))
+            if job['stage'] == 'done' or stale_download:
+                # Track was synced before but is missing locally again
+                queue.set_stage(spotify_url, service, 'queued', attempts=0, next_attempt_at=0)
+                job = queue.get(spotify_url, service)
+
+            if job['stage'] == 'resolving':
+                # Usually prefetch.py; starting our own lucida job now would orphan theirs
+                logging.info(f"Waiting for {artist} - {title} to be resolved on {service} by another process")
+                job = queue.wait_for_claim(spotify_url, service)
+
+            if job['stage'] in RESUMABLE_STAGES:
+                resumed = resume_job(queue, job)
+                if not resumed:
+                    sys.exit(1)
+                print(TrackRecord(name=title, artist=artist, url=spotify_url,
+                                  service=service, path=resumed['path']).to_json())
+                return
+
+            if job['stage'] == 'unavailable':
+                logging.info(f"{artist} - {title} is not available on {service}, skipping until recheck")
+                sys.exit(1)
+
+            if job['stage'] == 'resolved':
+                # Resolving it already counted as the attempt
+                service_url = job['service_url']
+                logging.info(f"Using resolved service URL from queue: {service_url}")
+            elif not queue.claim(spotify_url, service):
+                # Claimed so a prefetcher doesn't resolve the same track alongside us
+                logging.error(f"Not trying {artist} - {title} on {service} yet, backing off after earlier failures")
+                sys.exit(1)
 
-        service_url = get_redirect_with_browser(driver, spotify_url, service)
         if not service_url:
-            sys.exit(1)
+            slot = BrowserSlot(setup_driver)
+            driver = slot.acquire()
+
+            service_url = get_redirect_with_browser(driver, spotify_url, service)
+
+            # Nothing below needs the browser, give its share of the budget
+            # back before the (possibly minutes long) lucida conversion
+            slot.release()
+            slot = None
+
+            if not service_url:
+                if queue:
+                    queue.unavailable(spotify_url, service)
+                sys.exit(1)
+
+            if queue:
+                queue.set_stage(spotify_url, service, 'resolved', service_url=service_url)
+
+        # A Spotify track that resolved to SoundCloud can be fetched through the
+        # SoundCloud API directly, without a lucida job
+        if service == 'soundcloud' and 'soundcloud.com' in service_url and 'soundcloud.com' not in spotify_url:
+            try:
+                result = download_track(service_url, output_dir, artist, title)
+            except Exception as e:
+                logging.error(f"Direct SoundCloud download raised: {e}")
+                result = None
+            if result:
+                if queue:
+                    queue.set_stage(spotify_url, service, 'downloaded', path=result.path)
+                result.url = spotify_url
+                print(result.to_json())
+                return
+            logging.info("Direct SoundCloud download failed, falling back to lucida")
 
         download_info = initiate_download(service_url)
         if not download_info:
+            if queue:
+                queue.fail(spotify_url, service, 'initiate failed')
             sys.exit(1)
 
+        if queue:
+            queue.set_stage(spotify_url, service, 'handoff',
+                            request_id=download_info['request_id'],
+                            server_name=download_info['server_name'])
+
         if not poll_status(download_info['request_id'], download_info['server_name']):
+            if queue:
+                queue.fail(spotify_url, service, 'poll failed')
             sys.exit(1)
 
-        safe_artist = artist.replace('/', '_')
-        safe_title = title.replace('/', '_')
-        extension = "mp3" if service == "soundcloud" else "flac"
-        output_path = f"{output_dir}/{safe_artist} - {safe_title}.{extension}"
+        if queue:
+            queue.set_stage(spotify_url, service, 'completed')
+
+        output_path = build_output_path(output_dir, artist, title, service)
 
         if not download_file(download_info['request_id'], download_info['server_name'], output_path):
+            if queue:
+                queue.fail(spotify_url, service, 'download failed')
             sys.exit(1)
 
-        result = {
-            "path": output_path,
-            "artist": artist,
-            "title": title,
-            "service": service
-        }
-        print(json.dumps(result))
+        if queue:
+            queue.set_stage(spotify_url, service, 'downloaded', path=output_path)
+
+        result = TrackRecord(name=title, artist=artist, url=spotify_url, service=service, path=output_path)
+        print(result.to_json())
 
     except Exception as e:
         logging.error(f"Error: {e}")
+        if queue:
+            queue.fail(spotify_url, service, str(e))
         sys.exit(1)
     finally:
-        if driver:
-            driver.quit()
+        if slot:
+            slot.release()
+        if queue:
+            queue.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
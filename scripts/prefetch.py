@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import signal
+import argparse
+import logging
+
+from browser_governor import BrowserSlot
+from job_queue import JobQueue, CONTINUABLE_STAGES, default_db_path
+from lucida_browser import setup_driver, get_redirect_with_browser, initiate_download
+from track_record import iter_records
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: [prefetch] %(message)s')
+
+# Same order rip.sh tries services in for Spotify tracks
+SPOTIFY_SERVICES = ['qobuz', 'tidal', 'soundcloud']
+
+# Stages that mean a track is prefetched but not yet picked up by the downloader
+WAITING_STAGES = ['resolved', 'handoff', 'completed']
+
+DEFAULT_DEPTH = 2
+DEFAULT_EXPIRY = 1800
+WAIT_SECONDS = 5
+
+
+def count_ahead(queue, tracks):
+    """Number of tracks with a prefetched job still waiting for the downloader"""
+    ahead = 0
+    for track in tracks:
+        for service in SPOTIFY_SERVICES:
+            job = queue.get(track.url, service)
+            if job and job['stage'] in WAITING_STAGES:
+                ahead += 1
+                break
+    return ahead
+
+
+def prefetch_track(queue, slot, track, output_dir):
+    """Resolve a track and start its lucida job on the first service that has it"""
+    url, artist, title = track.url, track.artist, track.name
+
+    for service in SPOTIFY_SERVICES:
+        job = queue.enqueue(url, service, artist, title, output_dir)
+
+        if job['stage'] in CONTINUABLE_STAGES or job['stage'] == 'done':
+            return True
+
+        if job['stage'] != 'queued' or job['next_attempt_at'] > time.time():
+            # Unavailable on this service, or backing off after failures
+            continue
+
+        driver = slot.maybe_recycle() or slot.acquire()
+
+        # Claimed only once the browser is up, so the downloader never waits on
+        # us while we wait for the memory budget
+        if not queue.claim(url, service):
+            continue
+
+        try:
+            logging.info(f"Resolving {artist} - {title} on {service}")
+            service_url = get_redirect_with_browser(driver, url, service)
+            if not service_url:
+                queue.unavailable(url, service)
+                continue
+
+            # Downloaded through the SoundCloud API when its turn comes, no lucida job needed
+            if service == 'soundcloud' and 'soundcloud.com' in service_url:
+                queue.set_stage(url, service, 'resolved', service_url=service_url)
+                return True
+
+            # Kept claimed until the handoff is recorded, so the downloader
+            # can't start a second lucida job from a resolved URL
+            download_info = initiate_download(service_url)
+            if not download_info:
+                queue.fail(url, service, 'initiate failed')
+                continue
+        except Exception as e:
+            queue.fail(url, service, str(e))
+            continue
+        except BaseException:
+            # Stopped by the sync script mid-resolve, hand the job back
+            queue.unclaim(url, service)
+            raise
+
+        queue.set_stage(url, service, 'handoff', service_url=service_url,
+                        request_id=download_info['request_id'],
+                        server_name=download_info['server_name'])
+        logging.info(f"Prefetched {artist} - {title} on {service}")
+        return True
+
+    return False
+
+
+def run_prefetch(queue, tracks, output_dir, depth, expiry):
+    """Keep up to depth tracks resolved and converting ahead of the downloader"""
+    slot = BrowserSlot(setup_driver)
+    try:
+        index = 0
+        while index < len(tracks):
+            expired = queue.expire_handoffs(expiry)
+            if expired:
+                logging.info(f"Expired {expired} unused handoffs")
+
+            if count_ahead(queue, tracks) >= depth:
+                # Don't hold a share of the browser budget while idle
+                slot.release()
+                time.sleep(WAIT_SECONDS)
+                continue
+
+            prefetch_track(queue, slot, tracks[index], output_dir)
+            index += 1
+
+        logging.info("All queued tracks prefetched")
+    finally:
+        slot.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve and start lucida jobs for upcoming tracks ahead of time")
+    parser.add_argument('output_dir', help="Directory the tracks will be downloaded to")
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH,
+                        help=f"Tracks to keep prefetched ahead of the downloader (default: {DEFAULT_DEPTH})")
+    parser.add_argument('--expiry', type=int, default=DEFAULT_EXPIRY,
+                        help=f"Seconds before an unused handoff is discarded (default: {DEFAULT_EXPIRY})")
+    parser.add_argument('--skip', type=int, default=0,
+                        help="Leading tracks to leave alone because the downloader is already on them")
+    args = parser.parse_args()
+
+    db_path = default_db_path()
+    if not db_path:
+        print("ERROR: RIPPY_QUEUE_DB must be set, prefetched jobs are handed over through the job queue", file=sys.stderr)
+        return 1
+
+    # Tracks in diff.sh output format, one JSON object per line; only Spotify
+    # tracks go through lucida, SoundCloud ones are downloaded from the API
+    tracks = [track for track in iter_records(sys.stdin)
+              if track.url and 'open.spotify.com/track' in track.url]
+    tracks = tracks[args.skip:]
+
+    if not tracks or args.depth <= 0:
+        return 0
+
+    # Let the sync script stop us at any time without leaving Chrome behind
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    queue = JobQueue(db_path)
+    try:
+        run_prefetch(queue, tracks, args.output_dir, args.depth, args.expiry)
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
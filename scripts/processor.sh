@@ -90,6 +90,9 @@ process_track() {
 
   trap 'rm -f "$temp_art_file" "$compressed_file"' EXIT
 
+  # Per-process log so parallel transcodes don't overwrite each other's errors
+  local ffmpeg_log="/tmp/ffmpeg_error_$$.log"
+
   local ffmpeg_cmd="ffmpeg -nostdin -i \"$input_file\""
   
   if [[ -n "$artwork_file" && -f "$artwork_file" ]]; then
@@ -108,18 +111,18 @@ process_track() {
   ffmpeg_cmd+=" -loglevel error -nostats -y \"$output_file\""
   
   echo "INFO: Executing command: $ffmpeg_cmd" >&2
-  eval "$ffmpeg_cmd" 2>/tmp/ffmpeg_error.log
+  eval "$ffmpeg_cmd" 2>"$ffmpeg_log"
   
   local exit_code=$?
   if [[ $exit_code -ne 0 ]]; then
     echo "ERROR: ffmpeg command failed with exit code $exit_code" >&2
     echo "ERROR: ffmpeg error log:" >&2
-    cat /tmp/ffmpeg_error.log >&2
-    rm -f /tmp/ffmpeg_error.log
+    cat "$ffmpeg_log" >&2
+    rm -f "$ffmpeg_log"
     return $exit_code
   fi
   
-  rm -f /tmp/ffmpeg_error.log
+  rm -f "$ffmpeg_log"
   
   echo "INFO: Successfully converted to AIFF format: $output_file" >&2
 
@@ -29,6 +29,46 @@ urlencode() {
   echo "$encoded"
 }
 
+has_queued_handoff() {
+  local url="$1"
+  local service="$2"
+
+  [[ -n "$RIPPY_QUEUE_DB" ]] || return 1
+  python3 "$SCRIPT_DIR/job_queue.py" "$RIPPY_QUEUE_DB" has "$url" "$service" 2>/dev/null
+}
+
+# Runs a job_queue.py command when the queue is enabled, succeeding otherwise.
+# Lucida jobs started here are recorded like the ones lucida_browser.py starts,
+# so they are resumed after a crash and never started twice alongside prefetch.py
+queue_job() {
+  [[ -n "$RIPPY_QUEUE_DB" ]] || return 0
+  python3 "$SCRIPT_DIR/job_queue.py" "$RIPPY_QUEUE_DB" "$@" 2>/dev/null
+}
+
+download_with_browser() {
+  local url="$1"
+  local service="$2"
+  local artist="$3"
+  local title="$4"
+  local output_dir="$5"
+
+  local result
+  result=$(python3 "$SCRIPT_DIR/lucida_browser.py" "$url" "$service" "$artist" "$title" "$output_dir" 2>&1)
+  local exit_code=$?
+
+  if [[ $exit_code -eq 0 ]]; then
+    # Extract just the JSON result from the output
+    local json_result=$(echo "$result" | grep '^{' | tail -1)
+    if [[ -n "$json_result" ]]; then
+      echo "$json_result"
+      return 0
+    fi
+  fi
+
+  echo "ERROR: Browser-based download failed" >&2
+  return 1
+}
+
 json_extract() {
   local json="$1"
   local key="$2"
@@ -45,6 +85,26 @@ download_from_service() {
 
   echo "INFO: Trying to download from $service (attempt $attempt)..." >&2
 
+  # A handoff recorded by an earlier (possibly interrupted) run is resumed
+  # without resolving the track or starting a new lucida job
+  if has_queued_handoff "$spotify_url" "$service"; then
+    echo "INFO: Resuming queued lucida job for $service..." >&2
+    local result=$(python3 "$SCRIPT_DIR/lucida_browser.py" "$spotify_url" "$service" "$artist" "$title" "$output_dir" 2>&1)
+    local json_result=$(echo "$result" | grep '^{' | tail -1)
+    if [[ -n "$json_result" ]]; then
+      echo "$json_result"
+      return 0
+    fi
+    echo "INFO: Resume failed, starting over" >&2
+  fi
+
+  # Another process is resolving the track, or it is backing off, unavailable
+  # or synced before; lucida_browser.py handles all of those
+  if ! queue_job claim "$spotify_url" "$service" "$artist" "$title" "$output_dir"; then
+    download_with_browser "$spotify_url" "$service" "$artist" "$title" "$output_dir"
+    return
+  fi
+
   # First try with curl
   local encoded_url=$(urlencode "$spotify_url")
   local lucida_url="https://lucida.to/?url=${encoded_url}&country=auto&to=${service}"
@@ -58,27 +118,17 @@ download_from_service() {
   if [[ -z "$location" ]] || [[ "$redirect_response" == *"cloudflare"* ]] || [[ "$redirect_response" == *"cf-ray"* ]]; then
     echo "INFO: Detected Cloudflare protection, using browser-based approach..." >&2
 
-    # Use the Python script with selenium-stealth
-    local result=$(python3 "$SCRIPT_DIR/lucida_browser.py" "$spotify_url" "$service" "$artist" "$title" "$output_dir" 2>&1)
-    local exit_code=$?
-
-    if [[ $exit_code -eq 0 ]]; then
-      # Extract just the JSON result from the output
-      local json_result=$(echo "$result" | grep '^{' | tail -1)
-      if [[ -n "$json_result" ]]; then
-        echo "$json_result"
-        return 0
-      fi
-    fi
-
-    echo "ERROR: Browser-based download failed" >&2
-    return 1
+    # Use the Python script with selenium-stealth, it takes the claim itself
+    queue_job unclaim "$spotify_url" "$service"
+    download_with_browser "$spotify_url" "$service" "$artist" "$title" "$output_dir"
+    return
   fi
 
   echo "INFO: Received response from lucida.to" >&2
 
   if [[ "$location" == *"failed-to=$service"* ]]; then
     echo "INFO: Track not available on $service" >&2
+    queue_job unavailable "$spotify_url" "$service"
     return 1
   fi
 
@@ -89,6 +139,7 @@ download_from_service() {
   if [[ -z "$service_url" ]]; then
     echo "ERROR: Failed to extract service URL from redirect" >&2
     echo "DEBUG: Location header: $location" >&2
+    queue_job fail "$spotify_url" "$service" "no service URL"
     return 1
   fi
 
@@ -126,6 +177,7 @@ download_from_service() {
 
   if [[ -z "$request_id" ]]; then
     echo "ERROR: Failed to get request/handoff ID. Response: $post_response" >&2
+    queue_job fail "$spotify_url" "$service" "initiate failed"
     return 1
   fi
 
@@ -134,6 +186,9 @@ download_from_service() {
     server_name="hund"
   fi
 
+  queue_job stage "$spotify_url" "$service" handoff \
+    "service_url=$service_url" "request_id=$request_id" "server_name=$server_name"
+
   echo "INFO: Got handoff ID: $request_id on server: $server_name. Polling for status..." >&2
 
   local status="started"
@@ -163,15 +218,18 @@ download_from_service() {
 
     if [[ "$status" == "error" || "$status" == "failed" ]]; then
       echo "ERROR: Download failed with status: $status" >&2
+      queue_job fail "$spotify_url" "$service" "poll failed"
       return 1
     fi
   done
 
   if [[ "$status" != "completed" ]]; then
     echo "ERROR: Download timed out" >&2
+    queue_job fail "$spotify_url" "$service" "poll failed"
     return 1
   fi
 
+  queue_job stage "$spotify_url" "$service" completed
   echo "INFO: Download marked as completed, retrieving file..." >&2
 
   local safe_artist=$(echo "$artist" | sed 's/[\/]/_/g')
@@ -190,10 +248,12 @@ download_from_service() {
 
   if [[ $? -eq 0 && -f "${output_file}.${extension}" && -s "${output_file}.${extension}" ]]; then
     echo "INFO: Successfully downloaded to ${output_file}.${extension}" >&2
-    echo "{\"path\":\"${output_file}.${extension}\",\"artist\":\"$artist\",\"title\":\"$title\",\"service\":\"$service\"}"
+    queue_job stage "$spotify_url" "$service" downloaded "path=${output_file}.${extension}"
+    echo "{\"path\":\"${output_file}.${extension}\",\"artist\":\"$artist\",\"name\":\"$title\",\"service\":\"$service\"}"
     return 0
   else
     echo "ERROR: Failed to download file" >&2
+    queue_job fail "$spotify_url" "$service" "download failed"
     return 1
   fi
 }
@@ -266,6 +326,19 @@ rip_spotify_track() {
   local max_tidal_retries=2
   local tidal_retry_delay=10
 
+  # Pick up a job prefetched on any service first, rather than resolving the
+  # earlier services in the order again
+  local queued_service
+  for queued_service in qobuz tidal soundcloud; do
+    if has_queued_handoff "$spotify_url" "$queued_service"; then
+      result=$(download_from_service "$spotify_url" "$output_dir" "$queued_service" "$artist" "$title" "1")
+      if [[ $? -eq 0 && -n "$result" ]]; then
+        echo "$result"
+        return 0
+      fi
+    fi
+  done
+
   result=$(download_from_service "$spotify_url" "$output_dir" "qobuz" "$artist" "$title" "1")
   if [[ $? -eq 0 && -n "$result" ]]; then
     echo "$result"
@@ -281,6 +354,8 @@ rip_spotify_track() {
 
     if [[ $retry -lt $max_tidal_retries ]]; then
       echo "INFO: Tidal download failed, retrying in $tidal_retry_delay seconds..." >&2
+      # The queue backs a failed job off for longer than this, the retry is meant
+      queue_job retry "$spotify_url" "tidal"
       sleep $tidal_retry_delay
     fi
   done
@@ -316,16 +391,53 @@ rip_soundcloud_track() {
 
   local result=""
 
-  # Try SoundCloud -> Tidal first (better quality)
-  echo "INFO: Trying to find track on Tidal for better quality..." >&2
-  result=$(download_from_service "$soundcloud_url" "$output_dir" "tidal" "$artist" "$title" "1")
-  if [[ $? -eq 0 && -n "$result" ]]; then
+  # The original upload is the best quality there is, fetch it straight from the API.
+  # Direct downloads take artist/title from the API, matching the playlist listing
+  echo "INFO: Checking for a downloadable original on SoundCloud..." >&2
+  result=$(python3 "$SCRIPT_DIR/soundcloud_download.py" "$soundcloud_url" "$output_dir" --original-only | grep '^{' | tail -1)
+  if [[ -n "$result" ]]; then
+    echo "$result"
+    return 0
+  fi
+
+  # Optionally try SoundCloud -> Tidal next (better quality than the stream). Off by
+  # default as it opens a browser and starts a lucida job; skipped without either
+  # while the queue remembers Tidal not having the track
+  if [[ "$RIPPY_SOUNDCLOUD_TIDAL" == "true" ]]; then
+    echo "INFO: Trying to find track on Tidal for better quality..." >&2
+    result=$(download_from_service "$soundcloud_url" "$output_dir" "tidal" "$artist" "$title" "1")
+    if [[ $? -eq 0 && -n "$result" ]]; then
+      echo "$result"
+      return 0
+    fi
+  fi
+
+  # Download the stream via the authenticated API, no browser or lucida needed
+  echo "INFO: Downloading directly from SoundCloud API..." >&2
+  result=$(python3 "$SCRIPT_DIR/soundcloud_download.py" "$soundcloud_url" "$output_dir" | grep '^{' | tail -1)
+  if [[ -n "$result" ]]; then
     echo "$result"
     return 0
   fi
 
-  # If Tidal fails, download directly from SoundCloud (no service parameter)
-  echo "INFO: Tidal not available, downloading directly from SoundCloud..." >&2
+  # Last resort: let lucida fetch it from SoundCloud (no service parameter)
+  echo "INFO: Direct API download failed, downloading from SoundCloud via lucida..." >&2
+
+  if has_queued_handoff "$soundcloud_url" "soundcloud"; then
+    echo "INFO: Resuming queued lucida job for soundcloud..." >&2
+    local queued_result=$(python3 "$SCRIPT_DIR/lucida_browser.py" "$soundcloud_url" "soundcloud" "$artist" "$title" "$output_dir" 2>&1)
+    local queued_json=$(echo "$queued_result" | grep '^{' | tail -1)
+    if [[ -n "$queued_json" ]]; then
+      echo "$queued_json"
+      return 0
+    fi
+    echo "INFO: Resume failed, starting over" >&2
+  fi
+
+  if ! queue_job claim "$soundcloud_url" "soundcloud" "$artist" "$title" "$output_dir"; then
+    download_with_browser "$soundcloud_url" "soundcloud" "$artist" "$title" "$output_dir"
+    return
+  fi
 
   local encoded_url=$(urlencode "$soundcloud_url")
   local lucida_url="https://lucida.to/?url=${encoded_url}&country=auto"
@@ -338,20 +450,10 @@ rip_soundcloud_track() {
   if [[ -z "$location" ]] || [[ "$redirect_response" == *"cloudflare"* ]] || [[ "$redirect_response" == *"cf-ray"* ]]; then
     echo "INFO: Detected Cloudflare protection, using browser-based approach..." >&2
 
-    # Use the Python script with selenium-stealth
-    local browser_result=$(python3 "$SCRIPT_DIR/lucida_browser.py" "$soundcloud_url" "soundcloud" "$artist" "$title" "$output_dir" 2>&1)
-    local exit_code=$?
-
-    if [[ $exit_code -eq 0 ]]; then
-      local json_result=$(echo "$browser_result" | grep '^{' | tail -1)
-      if [[ -n "$json_result" ]]; then
-        echo "$json_result"
-        return 0
-      fi
-    fi
-
-    echo "ERROR: Browser-based download failed" >&2
-    return 1
+    # Use the Python script with selenium-stealth, it takes the claim itself
+    queue_job unclaim "$soundcloud_url" "soundcloud"
+    download_with_browser "$soundcloud_url" "soundcloud" "$artist" "$title" "$output_dir"
+    return
   fi
 
   echo "INFO: Processing direct SoundCloud download..." >&2
@@ -361,6 +463,7 @@ rip_soundcloud_track() {
 
   if [[ -z "$service_url" ]]; then
     echo "ERROR: Failed to extract service URL from redirect" >&2
+    queue_job fail "$soundcloud_url" "soundcloud" "no service URL"
     return 1
   fi
 
@@ -396,6 +499,7 @@ rip_soundcloud_track() {
 
   if [[ -z "$request_id" ]]; then
     echo "ERROR: Failed to get request/handoff ID" >&2
+    queue_job fail "$soundcloud_url" "soundcloud" "initiate failed"
     return 1
   fi
 
@@ -404,6 +508,8 @@ rip_soundcloud_track() {
     server_name="hund"
   fi
 
+  queue_job stage "$soundcloud_url" "soundcloud" handoff \
+    "service_url=$service_url" "request_id=$request_id" "server_name=$server_name"
   echo "INFO: Got handoff ID: $request_id on server: $server_name" >&2
 
   # Poll for completion
@@ -429,15 +535,19 @@ rip_soundcloud_track() {
 
     if [[ "$status" == "error" || "$status" == "failed" ]]; then
       echo "ERROR: Direct SoundCloud download failed" >&2
+      queue_job fail "$soundcloud_url" "soundcloud" "poll failed"
       return 1
     fi
   done
 
   if [[ "$status" != "completed" ]]; then
     echo "ERROR: Direct SoundCloud download timed out" >&2
+    queue_job fail "$soundcloud_url" "soundcloud" "poll failed"
     return 1
   fi
 
+  queue_job stage "$soundcloud_url" "soundcloud" completed
+
   # Download the file
   local safe_artist=$(echo "$artist" | sed 's/[\/]/_/g')
   local safe_title=$(echo "$title" | sed 's/[\/]/_/g')
@@ -467,10 +577,12 @@ rip_soundcloud_track() {
   done
 
   if [[ -n "$downloaded_file" && -f "$downloaded_file" ]]; then
-    echo "{\"path\":\"$downloaded_file\",\"artist\":\"$artist\",\"title\":\"$title\",\"service\":\"soundcloud\"}"
+    queue_job stage "$soundcloud_url" "soundcloud" downloaded "path=$downloaded_file"
+    echo "{\"path\":\"$downloaded_file\",\"artist\":\"$artist\",\"name\":\"$title\",\"service\":\"soundcloud\"}"
     return 0
   else
     echo "ERROR: Failed to download SoundCloud file" >&2
+    queue_job fail "$soundcloud_url" "soundcloud" "download failed"
     return 1
   fi
 }
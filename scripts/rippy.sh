@@ -139,6 +139,10 @@ process_track() {
     rm -f "$art_file"
   fi
 
+  if [[ -n "$RIPPY_QUEUE_DB" ]]; then
+    python3 "$SCRIPT_DIR/job_queue.py" "$RIPPY_QUEUE_DB" finish "$track_url" 2>/dev/null
+  fi
+
   log_info "Successfully processed track: $track_url"
   return 0
 }
@@ -154,6 +158,15 @@ sync_playlist() {
   local diff_output=$("$SCRIPT_DIR/diff.sh" "$playlist_url" "$output_dir")
 
   log_info "[$name] Processing tracks to download"
+
+  # Resolve and start lucida jobs for upcoming tracks while earlier ones download
+  local prefetch_pid=""
+  if [[ -n "$RIPPY_QUEUE_DB" && "${PREFETCH_DEPTH:-2}" -gt 0 ]]; then
+    echo "$diff_output" | grep '"action":"download"' | python3 "$SCRIPT_DIR/prefetch.py" "$output_dir" \
+      --depth "${PREFETCH_DEPTH:-2}" --expiry "${PREFETCH_EXPIRY:-1800}" --skip 1 &
+    prefetch_pid=$!
+  fi
+
   echo "$diff_output" | grep '"action":"download"' | while read -r line; do
     local track_url=$(echo "$line" | grep -o '"url":"[^"]*"' | sed 's/"url":"//;s/"//')
 
@@ -168,6 +181,11 @@ sync_playlist() {
     fi
   done
 
+  if [[ -n "$prefetch_pid" ]]; then
+    kill "$prefetch_pid" 2>/dev/null
+    wait "$prefetch_pid" 2>/dev/null
+  fi
+
   log_info "[$name] Processing tracks to delete"
   echo "$diff_output" | grep '"action":"delete"' | while read -r line; do
     local file_path=$(echo "$line" | grep -o '"file":"[^"]*"' | sed 's/"file":"//;s/"//')
@@ -261,6 +279,7 @@ start_playlist_sync() {
         export KEEP_ARTWORK='$KEEP_ARTWORK'
         export SPOTIFY_CLIENT_ID='$SPOTIFY_CLIENT_ID'
         export SPOTIFY_CLIENT_SECRET='$SPOTIFY_CLIENT_SECRET'
+        export RIPPY_QUEUE_DB='$output_dir/.rippy_jobs.db'
 
         source '$SCRIPT_DIR/utils.sh'
 
@@ -329,6 +348,14 @@ run_single_playlist() {
     load_secrets
 
     mkdir -p "$output_dir"
+    export RIPPY_QUEUE_DB=${RIPPY_QUEUE_DB:-"$output_dir/.rippy_jobs.db"}
+
+    # Pick up lucida jobs that were in flight when the container last stopped
+    if [[ -f "$RIPPY_QUEUE_DB" ]]; then
+        log_info "Resuming in-flight lucida jobs from $RIPPY_QUEUE_DB"
+        python3 "$SCRIPT_DIR/job_queue.py" "$RIPPY_QUEUE_DB" resume 2>&1
+    fi
+
     log_info "Starting in daemon mode, syncing every $SYNC_INTERVAL seconds"
 
     while true; do
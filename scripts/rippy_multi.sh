@@ -9,6 +9,9 @@ source "$SCRIPT_DIR/utils.sh"
 SYNC_INTERVAL=${SYNC_INTERVAL:-300}  # 5 minutes
 DOWNLOAD_INTERVAL=${DOWNLOAD_INTERVAL:-30}  # 30 seconds
 KEEP_ARTWORK=${KEEP_ARTWORK:-false}
+TRANSCODE_WORKERS=${TRANSCODE_WORKERS:-auto}  # 0 transcodes inline
+PREFETCH_DEPTH=${PREFETCH_DEPTH:-2}  # Tracks resolved ahead of the downloader, 0 disables
+PREFETCH_EXPIRY=${PREFETCH_EXPIRY:-1800}  # Seconds before an unused handoff is discarded
 
 load_secrets() {
   # Try to load from .env file first
@@ -65,6 +68,114 @@ get_soundcloud_artwork_url() {
   fi
 }
 
+finish_queued_job() {
+  local track_url="$1"
+
+  if [[ -n "$RIPPY_QUEUE_DB" ]]; then
+    python3 "$SCRIPT_DIR/job_queue.py" "$RIPPY_QUEUE_DB" finish "$track_url" 2>/dev/null
+  fi
+}
+
+resume_queued_jobs() {
+  if [[ -n "$RIPPY_QUEUE_DB" && -f "$RIPPY_QUEUE_DB" ]]; then
+    log_info "Resuming in-flight lucida jobs from $RIPPY_QUEUE_DB"
+    python3 "$SCRIPT_DIR/job_queue.py" "$RIPPY_QUEUE_DB" resume 2>&1
+  fi
+}
+
+start_transcode_pool() {
+  if [[ "$TRANSCODE_WORKERS" == "0" ]]; then
+    return 0
+  fi
+
+  local workers="$TRANSCODE_WORKERS"
+  if [[ "$workers" == "auto" ]]; then
+    workers=$(nproc 2>/dev/null || echo 1)
+  fi
+
+  # Downloads write jobs to fd 3; when the pool is busy the write blocks,
+  # which holds back further downloads
+  local fifo=$(mktemp -u /tmp/rippy_transcode.XXXXXX)
+  mkfifo "$fifo"
+  python3 "$SCRIPT_DIR/transcode_pool.py" --workers "$workers" < "$fifo" &
+  TRANSCODE_POOL_PID=$!
+  exec 3>"$fifo"
+  rm -f "$fifo"
+
+  log_info "Started transcode pool with $workers workers (PID: $TRANSCODE_POOL_PID)"
+}
+
+transcode_pool_running() {
+  if [[ -z "$TRANSCODE_POOL_PID" ]]; then
+    return 1
+  fi
+
+  if ! kill -0 "$TRANSCODE_POOL_PID" 2>/dev/null; then
+    log_warning "Transcode pool (PID: $TRANSCODE_POOL_PID) is not running, converting inline"
+    return 1
+  fi
+  return 0
+}
+
+ensure_transcode_pool() {
+  # Restart a pool that died during the last cycle, downloads fall back to
+  # inline conversion until then
+  if [[ -n "$TRANSCODE_POOL_PID" ]] && ! kill -0 "$TRANSCODE_POOL_PID" 2>/dev/null; then
+    log_warning "Transcode pool exited, restarting it"
+    exec 3>&-
+    wait "$TRANSCODE_POOL_PID" 2>/dev/null
+    TRANSCODE_POOL_PID=""
+    start_transcode_pool
+  fi
+}
+
+stop_transcode_pool() {
+  if [[ -n "$TRANSCODE_POOL_PID" ]]; then
+    log_info "Waiting for transcode pool to finish..."
+    exec 3>&-
+    wait "$TRANSCODE_POOL_PID"
+    TRANSCODE_POOL_PID=""
+  fi
+}
+
+submit_transcode() {
+  local track_path="$1"
+  local service="$2"
+  local track_url="$3"
+  local album_art_url="$4"
+
+  # Written by jq rather than echo: if the pool is gone only jq gets SIGPIPE,
+  # and the non-zero status lets the caller convert inline instead
+  jq -c -n \
+    --arg path "$track_path" \
+    --arg service "$service" \
+    --arg url "$track_url" \
+    --arg album_art "$album_art_url" \
+    '{path: $path, service: $service, url: $url, album_art: $album_art}' >&3
+}
+
+start_prefetch() {
+  local tracks="$1"
+  local output_dir="$2"
+
+  if [[ "$PREFETCH_DEPTH" -le 0 || -z "$RIPPY_QUEUE_DB" ]]; then
+    return 0
+  fi
+
+  # The first track is downloaded right away, prefetch the ones after it
+  echo "$tracks" | python3 "$SCRIPT_DIR/prefetch.py" "$output_dir" \
+    --depth "$PREFETCH_DEPTH" --expiry "$PREFETCH_EXPIRY" --skip 1 &
+  PREFETCH_PID=$!
+}
+
+stop_prefetch() {
+  if [[ -n "$PREFETCH_PID" ]]; then
+    kill "$PREFETCH_PID" 2>/dev/null
+    wait "$PREFETCH_PID" 2>/dev/null
+    PREFETCH_PID=""
+  fi
+}
+
 download_album_art() {
   local url="$1"
   local output_file="$2"
@@ -86,6 +197,7 @@ process_spotify_track() {
   local track_url="$1"
   local output_dir="$2"
   local playlist_name="$3"
+  local album_art_url="$4"
 
   local track_id=$(echo "$track_url" | grep -o 'track/[a-zA-Z0-9]*' | cut -d'/' -f2)
 
@@ -94,9 +206,6 @@ process_spotify_track() {
     return 1
   fi
 
-  log_info "[$playlist_name] Getting album art for track $track_id"
-  local album_art_url=$(get_album_art_url "$track_id")
-
   log_info "[$playlist_name] Ripping track: $track_url"
   local rip_result=$("$SCRIPT_DIR/rip.sh" "$track_url" "$output_dir" 2>&1)
 
@@ -116,6 +225,20 @@ process_spotify_track() {
     return 1
   fi
 
+  # The pool looks up artwork the playlist listing didn't have, many tracks at once
+  if transcode_pool_running; then
+    if submit_transcode "$track_path" "$service" "$track_url" "$album_art_url"; then
+      log_info "[$playlist_name] Queued for transcoding: $track_path"
+      return 0
+    fi
+    log_warning "[$playlist_name] Failed to queue for transcoding, converting inline"
+  fi
+
+  if [[ -z "$album_art_url" || "$album_art_url" == "null" ]]; then
+    log_info "[$playlist_name] Getting album art for track $track_id"
+    album_art_url=$(get_album_art_url "$track_id")
+  fi
+
   local art_file="${track_path%.*}_cover.jpg"
   download_album_art "$album_art_url" "$art_file"
 
@@ -131,6 +254,8 @@ process_spotify_track() {
     rm -f "$art_file"
   fi
 
+  finish_queued_job "$track_url"
+
   log_info "[$playlist_name] Successfully processed track: $track_url"
   return 0
 }
@@ -161,6 +286,14 @@ process_soundcloud_track() {
     return 1
   fi
 
+  if transcode_pool_running; then
+    if submit_transcode "$track_path" "$service" "$track_url" ""; then
+      log_info "[$playlist_name] Queued for transcoding: $track_path"
+      return 0
+    fi
+    log_warning "[$playlist_name] Failed to queue for transcoding, converting inline"
+  fi
+
   # Get SoundCloud artwork just like Spotify
   log_info "[$playlist_name] Getting album art for SoundCloud track"
   local album_art_url=$(get_soundcloud_artwork_url "$track_url")
@@ -182,6 +315,8 @@ process_soundcloud_track() {
     rm -f "$art_file"
   fi
 
+  finish_queued_job "$track_url"
+
   log_info "[$playlist_name] Successfully processed SoundCloud track: $track_url"
   return 0
 }
@@ -192,6 +327,7 @@ process_soundcloud_track_with_metadata() {
   local playlist_name="$3"
   local artist="$4"
   local title="$5"
+  local album_art_url="$6"
 
   log_info "[$playlist_name] Ripping SoundCloud track via lucida.to: $artist - $title"
 
@@ -214,9 +350,20 @@ process_soundcloud_track_with_metadata() {
     return 1
   fi
 
-  # Get SoundCloud artwork just like Spotify
-  log_info "[$playlist_name] Getting album art for SoundCloud track"
-  local album_art_url=$(get_soundcloud_artwork_url "$track_url")
+  # Artwork URL is already known from the playlist listing
+  if transcode_pool_running; then
+    if submit_transcode "$track_path" "$service" "$track_url" "$album_art_url"; then
+      log_info "[$playlist_name] Queued for transcoding: $track_path"
+      return 0
+    fi
+    log_warning "[$playlist_name] Failed to queue for transcoding, converting inline"
+  fi
+
+  # Get SoundCloud artwork just like Spotify, unless the playlist listing had it
+  if [[ -z "$album_art_url" || "$album_art_url" == "null" ]]; then
+    log_info "[$playlist_name] Getting album art for SoundCloud track"
+    album_art_url=$(get_soundcloud_artwork_url "$track_url")
+  fi
 
   local art_file="${track_path%.*}_cover.jpg"
   download_album_art "$album_art_url" "$art_file"
@@ -235,6 +382,8 @@ process_soundcloud_track_with_metadata() {
     rm -f "$art_file"
   fi
 
+  finish_queued_job "$track_url"
+
   log_info "[$playlist_name] Successfully processed SoundCloud track: $artist - $title"
   return 0
 }
@@ -243,10 +392,11 @@ process_track() {
   local track_url="$1"
   local output_dir="$2"
   local playlist_name="$3"
+  local album_art_url="$4"
 
   # Detect track type and call appropriate function
   if [[ "$track_url" == *"open.spotify.com/track"* ]]; then
-    process_spotify_track "$track_url" "$output_dir" "$playlist_name"
+    process_spotify_track "$track_url" "$output_dir" "$playlist_name" "$album_art_url"
   elif [[ "$track_url" == *"soundcloud.com"* ]]; then
     process_soundcloud_track "$track_url" "$output_dir" "$playlist_name"
   else
@@ -269,14 +419,19 @@ sync_spotify_playlist() {
   if [[ "$download_count" -gt 0 ]]; then
     log_info "[$name] Found $download_count tracks to download"
 
+    if [[ "$download_count" -gt 1 ]]; then
+      start_prefetch "$tracks_to_download" "$output_dir"
+    fi
+
     local current=0
     echo "$tracks_to_download" | while read -r line; do
       ((current++))
       local track_url=$(echo "$line" | grep -o '"url":"[^"]*"' | sed 's/"url":"//;s/"//')
+      local album_art=$(echo "$line" | jq -r '.album_art // empty')
 
       if [[ -n "$track_url" ]]; then
         log_info "[$name] Downloading track $current/$download_count: $track_url"
-        process_track "$track_url" "$output_dir" "$name"
+        process_track "$track_url" "$output_dir" "$name" "$album_art"
 
         if [[ "$current" -lt "$download_count" && -n "$DOWNLOAD_INTERVAL" && "$DOWNLOAD_INTERVAL" -gt 0 ]]; then
           log_info "[$name] Waiting $DOWNLOAD_INTERVAL seconds before next download..."
@@ -284,6 +439,8 @@ sync_spotify_playlist() {
         fi
       fi
     done
+
+    stop_prefetch
   else
     log_info "[$name] Playlist is up to date - no tracks to download"
   fi
@@ -311,11 +468,19 @@ sync_soundcloud_playlist() {
 
   log_info "[$name] Finding differences between SoundCloud playlist and local files"
 
-  # Get SoundCloud tracks in same format as Spotify
-  local sc_tracks=$(python3 "$SCRIPT_DIR/soundcloud_api.py" "$playlist_url" 2>&1)
-  if [[ $? -ne 0 ]]; then
-    log_error "[$name] Failed to get SoundCloud playlist tracks"
-    return 1
+  # Get SoundCloud tracks in same format as Spotify, preferring the batch
+  # fetched concurrently at the start of the sync cycle
+  local sc_tracks=""
+  if [[ -n "$SC_TRACKS_CACHE" && -s "$SC_TRACKS_CACHE" ]]; then
+    sc_tracks=$(jq -c --arg playlist "$playlist_url" 'select(.playlist == $playlist)' "$SC_TRACKS_CACHE")
+  fi
+
+  if [[ -z "$sc_tracks" ]]; then
+    sc_tracks=$(python3 "$SCRIPT_DIR/soundcloud_api.py" "$playlist_url" 2>&1)
+    if [[ $? -ne 0 ]]; then
+      log_error "[$name] Failed to get SoundCloud playlist tracks"
+      return 1
+    fi
   fi
 
   # Use same diff logic as Spotify - find files that need downloading
@@ -386,10 +551,11 @@ sync_soundcloud_playlist() {
       local track_url=$(echo "$line" | jq -r '.url')
       local artist=$(echo "$line" | jq -r '.artist')
       local title=$(echo "$line" | jq -r '.name')
+      local album_art=$(echo "$line" | jq -r '.album_art // empty')
 
       if [[ -n "$track_url" ]]; then
         log_info "[$name] Downloading track $current/$download_count: $artist - $title"
-        process_soundcloud_track_with_metadata "$track_url" "$output_dir" "$name" "$artist" "$title"
+        process_soundcloud_track_with_metadata "$track_url" "$output_dir" "$name" "$artist" "$title" "$album_art"
 
         if [[ "$current" -lt "$download_count" && -n "$DOWNLOAD_INTERVAL" && "$DOWNLOAD_INTERVAL" -gt 0 ]]; then
           log_info "[$name] Waiting $DOWNLOAD_INTERVAL seconds before next download..."
@@ -404,6 +570,23 @@ sync_soundcloud_playlist() {
   rm -f /tmp/sc_tracks_to_download
 }
 
+fetch_soundcloud_playlists() {
+  local cache_file="$1"
+  shift
+
+  : > "$cache_file"
+  if [[ $# -eq 0 ]]; then
+    return 0
+  fi
+
+  log_info "Fetching $# SoundCloud playlists concurrently"
+  python3 "$SCRIPT_DIR/soundcloud_async.py" "$@" > "$cache_file"
+
+  if [[ $? -ne 0 ]]; then
+    log_warning "Concurrent SoundCloud fetch failed, falling back to one playlist at a time"
+  fi
+}
+
 sync_playlist() {
   local name="$1"
   local playlist_url="$2"
@@ -474,10 +657,24 @@ sync_all_playlists() {
   log_info "Press Ctrl+C to stop"
   echo ""
 
+  local -a soundcloud_urls=()
+  for url in "${playlist_urls[@]}"; do
+    if [[ "$url" == *"soundcloud.com"* ]]; then
+      soundcloud_urls+=("$url")
+    fi
+  done
+
+  SC_TRACKS_CACHE=$(mktemp /tmp/sc_tracks.XXXXXX)
+  trap 'rm -f "$SC_TRACKS_CACHE"; stop_prefetch; stop_transcode_pool' EXIT
+
   # Main sync loop
   while true; do
     log_info "=== Starting sync cycle at $(date '+%Y-%m-%d %H:%M:%S') ==="
 
+    ensure_transcode_pool
+
+    fetch_soundcloud_playlists "$SC_TRACKS_CACHE" "${soundcloud_urls[@]}"
+
     for i in "${!playlist_urls[@]}"; do
       sync_playlist "${playlist_names[$i]}" "${playlist_urls[$i]}" "${playlist_dirs[$i]}"
       echo ""
@@ -498,6 +695,10 @@ usage() {
   echo "  --output-dir <dir>         Base output directory (default: $ROOT_DIR/music)"
   echo "  --sync-interval <seconds>  Time between syncs (default: 300)"
   echo "  --download-interval <secs> Time between downloads (default: 30)"
+  echo "  --queue-db <file>          Job queue database (default: <output-dir>/.rippy_jobs.db)"
+  echo "  --transcode-workers <n>    Parallel AIFF conversions (default: CPU cores, 0 = inline)"
+  echo "  --prefetch-depth <n>       Tracks resolved on lucida ahead of download (default: 2, 0 = off)"
+  echo "  --prefetch-expiry <secs>   Discard prefetched lucida jobs unused after this (default: 1800)"
   echo "  --client-id <id>           Spotify client ID"
   echo "  --client-secret <secret>   Spotify client secret"
   echo ""
@@ -532,6 +733,22 @@ while [[ $# -gt 0 ]]; do
       DOWNLOAD_INTERVAL="$2"
       shift 2
       ;;
+    --queue-db)
+      RIPPY_QUEUE_DB="$2"
+      shift 2
+      ;;
+    --transcode-workers)
+      TRANSCODE_WORKERS="$2"
+      shift 2
+      ;;
+    --prefetch-depth)
+      PREFETCH_DEPTH="$2"
+      shift 2
+      ;;
+    --prefetch-expiry)
+      PREFETCH_EXPIRY="$2"
+      shift 2
+      ;;
     --client-id)
       export SPOTIFY_CLIENT_ID="$2"
       shift 2
@@ -566,11 +783,18 @@ fi
 # Load credentials and start syncing
 load_secrets
 
+mkdir -p "$OUTPUT_DIR"
+export RIPPY_QUEUE_DB=${RIPPY_QUEUE_DB:-"$OUTPUT_DIR/.rippy_jobs.db"}
+
 log_info "Starting multi-playlist sync"
 log_info "Playlist file: $PLAYLIST_FILE"
 log_info "Output directory: $OUTPUT_DIR"
 log_info "Sync interval: $SYNC_INTERVAL seconds"
 log_info "Download interval: $DOWNLOAD_INTERVAL seconds"
+log_info "Job queue: $RIPPY_QUEUE_DB"
 echo ""
 
+resume_queued_jobs
+start_transcode_pool
+
 sync_all_playlists "$PLAYLIST_FILE" "$OUTPUT_DIR"
\ No newline at end of file
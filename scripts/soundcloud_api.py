@@ -6,10 +6,15 @@ import json
 import requests
 import time
 from urllib.parse import urlparse
+from track_record import TrackRecord, write_records
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(SCRIPT_DIR)
 
+# Tracks per page when paging through playlists too large for /resolve
+PAGE_SIZE = 200
+REQUEST_TIMEOUT = 30
+
 def load_soundcloud_secrets():
     """Load SoundCloud credentials from token file"""
     token_file = os.path.join(ROOT_DIR, '.soundcloud_tokens')
@@ -22,12 +27,7 @@ def load_soundcloud_secrets():
         with open(token_file, 'r') as f:
             token_data = json.load(f)
 
-        # Check if token might be expired
-        created_at = token_data.get('created_at', 0)
-        expires_in = token_data.get('expires_in', 3600)
-        current_time = int(time.time())
-
-        if current_time > (created_at + expires_in - 300):  # Refresh 5 minutes before expiry
+        if token_needs_refresh(token_data):
             print("INFO: Access token is near expiry, attempting refresh...", file=sys.stderr)
             new_token = refresh_access_token_from_file(token_data)
             if new_token:
@@ -43,6 +43,14 @@ def load_soundcloud_secrets():
         print(f"ERROR: Failed to load tokens: {e}", file=sys.stderr)
         return None
 
+def token_needs_refresh(token_data):
+    """Check if the access token is expired or about to expire"""
+    created_at = token_data.get('created_at', 0)
+    expires_in = token_data.get('expires_in', 3600)
+    current_time = int(time.time())
+
+    return current_time > (created_at + expires_in - 300)  # Refresh 5 minutes before expiry
+
 def refresh_access_token_from_file(token_data):
     """Refresh access token using refresh token from file data"""
     if 'refresh_token' not in token_data:
@@ -86,7 +94,7 @@ def make_api_request(url, access_token, params=None):
         'Accept': 'application/json'
     }
 
-    response = requests.get(url, headers=headers, params=params)
+    response = requests.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
 
     if response.status_code == 401:
         print("WARNING: Access token may be expired. Try running soundcloud_auth.py again.", file=sys.stderr)
@@ -124,6 +132,37 @@ def resolve_playlist_url(playlist_url, access_token):
     playlist_data = make_api_request(resolve_url, access_token, params)
     return playlist_data
 
+def streamable_records(tracks, playlist=None):
+    """Records for the streamable tracks of a list of API tracks"""
+    records = []
+    for track in tracks:
+        if track.get('streamable', False):
+            records.append(TrackRecord.from_soundcloud(track, playlist=playlist))
+        else:
+            print(f"INFO: Skipping non-streamable track: {track.get('title')}", file=sys.stderr)
+    return records
+
+def get_playlist_records(playlist_id, access_token, playlist=None):
+    """Records for all streamable tracks of a playlist, following pagination
+
+    Each page is converted as it arrives, so the full API payloads of a
+    large playlist are never held all at once.
+    """
+    records = []
+    url = f"https://api.soundcloud.com/playlists/{playlist_id}/tracks"
+    params = {'linked_partitioning': 'true', 'limit': PAGE_SIZE}
+
+    while url:
+        page = make_api_request(url, access_token, params)
+        if page is None:
+            return None
+        records.extend(streamable_records(page.get('collection', []), playlist))
+        # next_href already carries the query string
+        url = page.get('next_href')
+        params = None
+
+    return records
+
 def get_soundcloud_playlist_tracks(playlist_url):
     """Get tracks from a SoundCloud playlist"""
     token_data = load_soundcloud_secrets()
@@ -143,33 +182,22 @@ def get_soundcloud_playlist_tracks(playlist_url):
         print(f"ERROR: URL does not point to a playlist. Kind: {playlist_data.get('kind')}", file=sys.stderr)
         return 1
 
+    playlist_id = playlist_data['id']
     tracks = playlist_data.get('tracks', [])
-    print(f"INFO: Found {len(tracks)} tracks in playlist", file=sys.stderr)
+    truncated = playlist_data.get('track_count', len(tracks)) > len(tracks)
 
-    track_count = 0
-    for track in tracks:
-        if track.get('streamable', False):
-            # Output track info in JSON format similar to spotify.sh
-            track_info = {
-                'id': str(track['id']),
-                'name': track['title'],
-                'artist': track['user']['username'],
-                'album': 'SoundCloud',  # SoundCloud doesn't have albums
-                'album_art': track.get('artwork_url', 'null'),
-                'url': track['permalink_url'],
-                'duration': track.get('duration', 0),
-                'service': 'soundcloud'
-            }
-
-            # Replace artwork URL size if available
-            if track_info['album_art'] and track_info['album_art'] != 'null':
-                # Replace t500x500 with t500x500 (largest available)
-                track_info['album_art'] = track_info['album_art'].replace('large', 't500x500')
-
-            print(json.dumps(track_info))
-            track_count += 1
-        else:
-            print(f"INFO: Skipping non-streamable track: {track['title']}", file=sys.stderr)
+    # Keep the records only, not the payloads with their nested user objects
+    records = None if truncated else streamable_records(tracks)
+    del playlist_data, tracks
+
+    # resolve truncates large playlists, page through the rest
+    if truncated:
+        records = get_playlist_records(playlist_id, access_token)
+        if records is None:
+            return 1
+
+    # Output track info in the same JSON lines format as spotify.sh
+    track_count = write_records(records)
 
     print(f"INFO: Output {track_count} streamable tracks", file=sys.stderr)
     return 0
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import aiohttp
+
+from soundcloud_api import (ROOT_DIR, PAGE_SIZE, get_playlist_id_from_url, save_updated_token,
+                            streamable_records, token_needs_refresh)
+from track_record import write_records
+
+API_BASE = "https://api.soundcloud.com"
+TOKEN_URL = "https://api.soundcloud.com/oauth2/token"
+DEFAULT_CONCURRENCY = 8
+# Seconds for a whole request, so one stalled playlist can't hold up the batch
+REQUEST_TIMEOUT = 60
+
+
+class AsyncSoundCloudClient:
+    """Authenticated SoundCloud API client sharing one session and token"""
+
+    def __init__(self, token_data, session):
+        self.token_data = token_data
+        self.session = session
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def access_token(self):
+        return self.token_data['access_token']
+
+    async def refresh_token(self):
+        """Refresh the access token once, even if many requests hit a 401 together"""
+        stale_token = self.access_token
+
+        async with self._refresh_lock:
+            if self.access_token != stale_token:
+                # Another request already refreshed it while we waited
+                return True
+
+            if 'refresh_token' not in self.token_data:
+                print("INFO: No refresh token available. Using existing access token.", file=sys.stderr)
+                return False
+
+            data = {
+                'client_id': self.token_data['client_id'],
+                'client_secret': self.token_data['client_secret'],
+                'grant_type': 'refresh_token',
+                'refresh_token': self.token_data['refresh_token']
+            }
+
+            async with self.session.post(TOKEN_URL, data=data) as response:
+                if response.status != 200:
+                    print(f"WARNING: Failed to refresh token. Status: {response.status}", file=sys.stderr)
+                    return False
+                tokens = await response.json()
+
+            self.token_data['access_token'] = tokens['access_token']
+            if 'refresh_token' in tokens:
+                self.token_data['refresh_token'] = tokens['refresh_token']
+            save_updated_token(self.token_data)
+            print("INFO: Access token refreshed successfully.", file=sys.stderr)
+            return True
+
+    async def request(self, url, params=None, retry=True):
+        """Make an authenticated GET request, refreshing the token on 401"""
+        if not url.startswith('http'):
+            url = f"{API_BASE}{url}"
+
+        headers = {
+            'Authorization': f'OAuth {self.access_token}',
+            'Accept': 'application/json'
+        }
+
+        async with self.session.get(url, headers=headers, params=params) as response:
+            if response.status == 401 and retry:
+                if await self.refresh_token():
+                    return await self.request(url, params, retry=False)
+                print("WARNING: Access token may be expired. Try running soundcloud_auth.py again.", file=sys.stderr)
+                return None
+
+            if response.status != 200:
+                print(f"ERROR: API request failed with status {response.status}: {url}", file=sys.stderr)
+                return None
+
+            return await response.json()
+
+    async def resolve(self, url):
+        return await self.request('/resolve', {'url': url})
+
+    async def me(self):
+        return await self.request('/me')
+
+    async def playlist_records(self, playlist_id, playlist_url):
+        """Records for all streamable tracks of a playlist, converting each page as it arrives"""
+        records = []
+        url = f"/playlists/{playlist_id}/tracks"
+        params = {'linked_partitioning': 'true', 'limit': PAGE_SIZE}
+
+        while url:
+            page = await self.request(url, params)
+            if page is None:
+                return None
+            records.extend(streamable_records(page.get('collection', []), playlist_url))
+            # next_href already carries the query string
+            url = page.get('next_href')
+            params = None
+
+        return records
+
+    async def get_playlist(self, playlist_url):
+        """Resolve a playlist URL and return records for its streamable tracks"""
+        playlist_data = await self.resolve(playlist_url)
+        if not playlist_data:
+            return None
+
+        if playlist_data.get('kind') != 'playlist':
+            print(f"ERROR: {playlist_url} does not point to a playlist. Kind: {playlist_data.get('kind')}", file=sys.stderr)
+            return None
+
+        playlist_id = playlist_data['id']
+        tracks = playlist_data.get('tracks', [])
+        truncated = playlist_data.get('track_count', len(tracks)) > len(tracks)
+
+        # Many playlists are in flight at once, keep only their records
+        records = None if truncated else streamable_records(tracks, playlist_url)
+        del playlist_data, tracks
+
+        # resolve truncates large playlists, page through the rest
+        if truncated:
+            records = await self.playlist_records(playlist_id, playlist_url)
+
+        return records
+
+
+def load_token_file():
+    """Read .soundcloud_tokens without refreshing, the client refreshes asynchronously"""
+    token_file = os.path.join(ROOT_DIR, '.soundcloud_tokens')
+
+    if not os.path.exists(token_file):
+        print("ERROR: .soundcloud_tokens not found. Run soundcloud_auth.py first.", file=sys.stderr)
+        return None
+
+    try:
+        with open(token_file, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print("ERROR: Invalid .soundcloud_tokens file. Run soundcloud_auth.py again.", file=sys.stderr)
+        return None
+
+
+def read_playlist_file(playlist_file):
+    """SoundCloud playlist URLs from a playlists.txt style file"""
+    urls = []
+    with open(playlist_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            url = line.split()[0]
+            if 'soundcloud.com/' in url and '/sets/' in url:
+                urls.append(url)
+    return urls
+
+
+async def fetch_playlists(playlist_urls, concurrency=DEFAULT_CONCURRENCY, out=sys.stdout):
+    """Fetch all playlists concurrently, writing tracks as JSON lines tagged with their playlist"""
+    token_data = load_token_file()
+    if not token_data:
+        return 1
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        client = AsyncSoundCloudClient(token_data, session)
+
+        if token_needs_refresh(token_data):
+            print("INFO: Access token is near expiry, attempting refresh...", file=sys.stderr)
+            try:
+                await client.refresh_token()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"WARNING: Failed to refresh token: {e!r}", file=sys.stderr)
+
+        async def fetch_one(playlist_url):
+            async with semaphore:
+                print(f"INFO: Fetching SoundCloud playlist: {playlist_url}", file=sys.stderr)
+                try:
+                    return playlist_url, await client.get_playlist(playlist_url)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    # ContentTypeError is a ClientError, a bad JSON body a ValueError
+                    print(f"ERROR: Request for {playlist_url} failed: {e!r}", file=sys.stderr)
+                    return playlist_url, None
+
+        tasks = [asyncio.create_task(fetch_one(url)) for url in playlist_urls]
+
+        # Emit each playlist as soon as it is done rather than in input order
+        for task in asyncio.as_completed(tasks):
+            playlist_url, tracks = await task
+            if tracks is None:
+                print(f"ERROR: Failed to fetch playlist: {playlist_url}", file=sys.stderr)
+                failures += 1
+                continue
+
+            write_records(tracks, out)
+            print(f"INFO: Output {len(tracks)} streamable tracks from {playlist_url}", file=sys.stderr)
+
+    return 1 if failures == len(playlist_urls) else 0
+
+
+async def test_api_access():
+    token_data = load_token_file()
+    if not token_data:
+        return 1
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as session:
+        client = AsyncSoundCloudClient(token_data, session)
+        try:
+            user_data = await client.me()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"ERROR: {e!r}", file=sys.stderr)
+            user_data = None
+
+    if user_data:
+        print(f"✅ API access successful! Authenticated as: {user_data.get('username', 'Unknown')}")
+        return 0
+    else:
+        print("❌ API access failed")
+        return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch many SoundCloud playlists concurrently as JSON lines")
+    parser.add_argument('urls', nargs='*', help="SoundCloud playlist URLs, or 'test' to test API access")
+    parser.add_argument('--playlist-file', help="File with playlist URLs (one per line, # for comments)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Maximum playlists fetched at once (default: {DEFAULT_CONCURRENCY})")
+    args = parser.parse_args()
+
+    if args.urls == ['test']:
+        return asyncio.run(test_api_access())
+
+    playlist_urls = list(args.urls)
+    if args.playlist_file:
+        playlist_urls.extend(read_playlist_file(args.playlist_file))
+
+    playlist_urls = [url for url in dict.fromkeys(playlist_urls) if get_playlist_id_from_url(url)]
+    if not playlist_urls:
+        parser.print_usage(sys.stderr)
+        return 1
+
+    started = time.time()
+    result = asyncio.run(fetch_playlists(playlist_urls, max(1, args.concurrency)))
+    print(f"INFO: Fetched {len(playlist_urls)} playlists in {time.time() - started:.1f}s", file=sys.stderr)
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import shutil
+import subprocess
+import requests
+
+from soundcloud_api import REQUEST_TIMEOUT, load_soundcloud_secrets, make_api_request
+from track_record import TrackRecord
+
+API_BASE = "https://api.soundcloud.com"
+
+# processor.sh writes <name>.aiff and diff.sh counts .wav and .aiff files as
+# synced, so originals with those extensions are saved under another name
+RENAMED_EXTENSIONS = {'aiff': 'aif', 'wav': 'wave'}
+
+def resolve_track(track_url, access_token):
+    """Resolve a SoundCloud track URL to its API data"""
+    track_data = make_api_request(f"{API_BASE}/resolve", access_token, {'url': track_url})
+    if not track_data:
+        return None
+
+    if track_data.get('kind') != 'track':
+        print(f"ERROR: URL does not point to a track. Kind: {track_data.get('kind')}", file=sys.stderr)
+        return None
+
+    return track_data
+
+def get_stream_url(track_id, access_token):
+    """Get the progressive MP3 stream URL for a track"""
+    streams = make_api_request(f"{API_BASE}/tracks/{track_id}/streams", access_token)
+    if not streams:
+        return None
+
+    return streams.get('http_mp3_128_url')
+
+def download_to_file(url, access_token, output_path):
+    """Stream a URL to output_path, writing to a temp file first so partial downloads never look finished"""
+    headers = {'Authorization': f'OAuth {access_token}'}
+
+    tmp_path = output_path + '.part'
+    try:
+        # requests drops the Authorization header when redirected to the CDN host.
+        # The timeout also applies between chunks, so a stalled CDN connection fails
+        response = requests.get(url, headers=headers, stream=True, allow_redirects=True,
+                                timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            print(f"ERROR: Download failed with status {response.status_code}", file=sys.stderr)
+            return None
+
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=65536):
+                f.write(chunk)
+    except requests.RequestException as e:
+        print(f"ERROR: Download failed: {e}", file=sys.stderr)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    if os.path.getsize(tmp_path) < 1000:
+        print("ERROR: Downloaded file is too small, discarding", file=sys.stderr)
+        os.remove(tmp_path)
+        return None
+
+    os.replace(tmp_path, output_path)
+    return response
+
+def original_extension(track_data, response):
+    """File extension of an original upload, from the filename SoundCloud sends"""
+    disposition = response.headers.get('Content-Disposition', '')
+    match = re.search(r'filename="?[^";]*\.([A-Za-z0-9]+)"?', disposition)
+    extension = match.group(1).lower() if match else (track_data.get('original_format') or 'mp3')
+    return RENAMED_EXTENSIONS.get(extension, extension)
+
+def tag_file(path, artist, title):
+    """Write artist/title tags, processor.sh carries them into the AIFF and names it after them
+
+    SoundCloud streams come without tags, unlike lucida's downloads.
+    """
+    if not shutil.which('ffmpeg'):
+        print("WARNING: ffmpeg not found, leaving download untagged", file=sys.stderr)
+        return False
+
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.tagging{extension}"
+    command = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', path, '-map', '0', '-c', 'copy',
+               '-metadata', f'artist={artist}', '-metadata', f'title={title}']
+    if extension == '.mp3':
+        command += ['-id3v2_version', '3']
+    elif extension == '.wave':
+        # ffmpeg only picks the WAV muxer from a .wav name
+        command += ['-f', 'wav']
+    result = subprocess.run(command + [tmp_path], capture_output=True, text=True)
+
+    if result.returncode != 0:
+        print(f"WARNING: Failed to tag {path}: {result.stderr.strip()}", file=sys.stderr)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+    os.replace(tmp_path, path)
+    return True
+
+def download_track(track_url, output_dir, artist=None, title=None, original_only=False):
+    """Download a SoundCloud track straight from the API, without lucida
+
+    Uses the original upload when the artist allows downloads, otherwise the
+    128 kbps MP3 stream. Returns a TrackRecord with the downloaded path.
+    """
+    token_data = load_soundcloud_secrets()
+    if not token_data:
+        return None
+
+    access_token = token_data['access_token']
+
+    track_data = resolve_track(track_url, access_token)
+    if not track_data:
+        return None
+
+    artist = artist or track_data['user']['username']
+    title = title or track_data['title']
+    safe_artist = artist.replace('/', '_')
+    safe_title = title.replace('/', '_')
+    base_path = f"{output_dir}/{safe_artist} - {safe_title}"
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    if track_data.get('downloadable'):
+        print(f"INFO: Downloading original upload: {artist} - {title}", file=sys.stderr)
+        download_path = base_path + '.download'
+        response = download_to_file(f"{API_BASE}/tracks/{track_data['id']}/download", access_token, download_path)
+        if response is not None:
+            output_path = f"{base_path}.{original_extension(track_data, response)}"
+            os.replace(download_path, output_path)
+            tag_file(output_path, artist, title)
+            return TrackRecord(name=title, artist=artist, url=track_url, service='soundcloud', path=output_path)
+        print("INFO: Original download unavailable, falling back to stream", file=sys.stderr)
+
+    if original_only:
+        print(f"INFO: No original upload available for: {artist} - {title}", file=sys.stderr)
+        return None
+
+    stream_url = get_stream_url(track_data['id'], access_token)
+    if not stream_url:
+        print(f"ERROR: No progressive stream available for: {artist} - {title}", file=sys.stderr)
+        return None
+
+    print(f"INFO: Downloading stream: {artist} - {title}", file=sys.stderr)
+    output_path = f"{base_path}.mp3"
+    if download_to_file(stream_url, access_token, output_path) is None:
+        return None
+    tag_file(output_path, artist, title)
+
+    return TrackRecord(name=title, artist=artist, url=track_url, service='soundcloud', path=output_path)
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != '--original-only']
+    original_only = len(args) != len(sys.argv) - 1
+
+    if len(args) < 2:
+        print("Usage: soundcloud_download.py <soundcloud_track_url> <output_dir> [artist] [title] [--original-only]", file=sys.stderr)
+        return 1
+
+    track_url = args[0]
+    output_dir = args[1]
+    artist = args[2] if len(args) > 2 else None
+    title = args[3] if len(args) > 3 else None
+
+    result = download_track(track_url, output_dir, artist, title, original_only)
+    if not result:
+        return 1
+
+    print(f"INFO: Successfully downloaded to {result.path}", file=sys.stderr)
+    print(result.to_json())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+
+
+def soundcloud_artwork_url(track):
+    """Highest quality artwork URL of a SoundCloud API track, touching nothing else"""
+    artwork_url = track.get('artwork_url')
+    if artwork_url:
+        # Replace with highest quality version
+        artwork_url = artwork_url.replace('large', 't500x500')
+    return artwork_url
+
+
+class TrackRecord:
+    """The fields of a track the pipeline actually uses, passed between stages as one JSON line
+
+    Keeps only what diffing, downloading and tagging need, so large playlists
+    don't hold on to full API payloads (nested user objects, waveforms, ...).
+    """
+
+    __slots__ = ('id', 'name', 'artist', 'album', 'album_art', 'url', 'duration', 'service', 'path', 'playlist')
+
+    def __init__(self, id=None, name=None, artist=None, album=None, album_art=None, url=None,
+                 duration=None, service=None, path=None, playlist=None):
+        self.id = id
+        self.name = name
+        self.artist = artist
+        self.album = album
+        self.album_art = album_art
+        self.url = url
+        self.duration = duration
+        self.service = service
+        self.path = path
+        self.playlist = playlist
+
+    @classmethod
+    def from_soundcloud(cls, track, playlist=None):
+        """Build a record from a SoundCloud API track, in the format spotify.sh uses"""
+        return cls(
+            id=str(track['id']),
+            name=track['title'],
+            artist=track['user']['username'],
+            album='SoundCloud',  # SoundCloud doesn't have albums
+            album_art=soundcloud_artwork_url(track),
+            url=track['permalink_url'],
+            duration=track.get('duration', 0),
+            service='soundcloud',
+            playlist=playlist
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a dict, ignoring keys the pipeline doesn't use"""
+        return cls(**{field: data.get(field) for field in cls.__slots__})
+
+    @classmethod
+    def from_json(cls, line):
+        return cls.from_dict(json.loads(line))
+
+    def to_dict(self):
+        """Set fields only, so optional ones don't bloat every line"""
+        data = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    def to_json(self):
+        # Compact separators also keep the output matchable by the grep '"key":"' patterns in the shell scripts
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def __repr__(self):
+        return f"TrackRecord({self.artist!r} - {self.name!r}, {self.service!r})"
+
+
+def iter_records(stream):
+    """Parse records one line at a time, skipping log lines mixed into captured output"""
+    for line in stream:
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        try:
+            yield TrackRecord.from_json(line)
+        except (json.JSONDecodeError, TypeError):
+            print(f"WARNING: Skipping invalid track line: {line[:100]}", file=sys.stderr)
+
+
+def write_records(records, stream=sys.stdout):
+    """Write records as they are produced, one JSON line each. Returns the count"""
+    count = 0
+    for record in records:
+        stream.write(record.to_json())
+        stream.write('\n')
+        count += 1
+    stream.flush()
+    return count
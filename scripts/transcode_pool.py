@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import json
+import stat
+import time
+import fcntl
+import queue
+import argparse
+import threading
+import subprocess
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+from job_queue import JobQueue, default_db_path
+from track_record import iter_records, soundcloud_artwork_url
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Spotify artwork is looked up for up to 50 tracks per API call
+SPOTIFY_BATCH_SIZE = 50
+BATCH_WAIT_SECONDS = 1.0
+# Smallest pipe the kernel allows, it rounds up to a page
+PIPE_SIZE = 4096
+REQUEST_TIMEOUT = 30
+
+# Client credentials token, reused across batches until shortly before it expires
+_spotify_token = {'access_token': None, 'expires_at': 0}
+
+
+def aiff_path(track_path):
+    return os.path.splitext(track_path)[0] + '.aiff'
+
+
+def already_transcoded(track_path):
+    """A track is done when its AIFF exists or the source was already consumed"""
+    return os.path.exists(aiff_path(track_path)) or not os.path.exists(track_path)
+
+
+def spotify_track_id(track_url):
+    if 'open.spotify.com/track/' not in track_url:
+        return None
+    return track_url.split('/track/')[1].split('?')[0]
+
+
+def get_spotify_token():
+    """Client credentials access token, cached for the lifetime of the pool"""
+    if _spotify_token['access_token'] and time.time() < _spotify_token['expires_at']:
+        return _spotify_token['access_token']
+
+    client_id = os.environ.get('SPOTIFY_CLIENT_ID')
+    client_secret = os.environ.get('SPOTIFY_CLIENT_SECRET')
+    if not client_id or not client_secret:
+        return None
+
+    response = requests.post(
+        "https://accounts.spotify.com/api/token",
+        data={'grant_type': 'client_credentials', 'client_id': client_id, 'client_secret': client_secret},
+        timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code != 200:
+        logging.warning(f"Failed to get Spotify access token: {response.status_code}")
+        return None
+
+    tokens = response.json()
+    _spotify_token['access_token'] = tokens['access_token']
+    _spotify_token['expires_at'] = time.time() + tokens.get('expires_in', 3600) - 60
+    return _spotify_token['access_token']
+
+
+def fetch_spotify_artwork(track_ids):
+    """Album art URLs for up to 50 Spotify tracks in one request"""
+    if not track_ids:
+        return {}
+
+    access_token = get_spotify_token()
+    if not access_token:
+        return {}
+
+    response = requests.get(
+        "https://api.spotify.com/v1/tracks",
+        headers={'Authorization': f'Bearer {access_token}'},
+        params={'ids': ','.join(track_ids)},
+        timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code != 200:
+        logging.warning(f"Spotify artwork lookup failed: {response.status_code}")
+        return {}
+
+    artwork = {}
+    for track in response.json().get('tracks', []):
+        if track and track.get('album', {}).get('images'):
+            artwork[track['id']] = track['album']['images'][0]['url']
+    return artwork
+
+
+def fetch_soundcloud_artwork(track_urls):
+    """Artwork URLs for SoundCloud tracks, keyed by permalink URL"""
+    from soundcloud_api import load_soundcloud_secrets, make_api_request
+
+    token_data = load_soundcloud_secrets()
+    if not track_urls or not token_data:
+        return {}
+
+    artwork = {}
+    for track_url in track_urls:
+        try:
+            track_data = make_api_request("https://api.soundcloud.com/resolve", token_data['access_token'],
+                                          {'url': track_url})
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f"SoundCloud artwork lookup failed for {track_url}: {e}")
+            continue
+        if track_data and track_data.get('artwork_url'):
+            artwork[track_url] = soundcloud_artwork_url(track_data)
+    return artwork
+
+
+def fill_artwork(jobs):
+    """Look up missing artwork for a batch of jobs with as few API calls as possible"""
+    spotify_ids = {}
+    soundcloud_urls = []
+
+    for job in jobs:
+        if job.album_art and job.album_art != 'null':
+            continue
+        if os.path.exists(cover_path(job.path)):
+            continue
+
+        track_url = job.url or ''
+        track_id = spotify_track_id(track_url)
+        if track_id:
+            spotify_ids[track_id] = job
+        elif 'soundcloud.com' in track_url:
+            soundcloud_urls.append(track_url)
+
+    # A failed lookup only costs that batch its artwork, the tracks are still transcoded
+    ids = list(spotify_ids)
+    for start in range(0, len(ids), SPOTIFY_BATCH_SIZE):
+        try:
+            artwork = fetch_spotify_artwork(ids[start:start + SPOTIFY_BATCH_SIZE])
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logging.warning(f"Spotify artwork lookup failed: {e}")
+            continue
+        for track_id, url in artwork.items():
+            spotify_ids[track_id].album_art = url
+
+    if soundcloud_urls:
+        try:
+            artwork = fetch_soundcloud_artwork(soundcloud_urls)
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f"SoundCloud artwork lookup failed: {e}")
+            artwork = {}
+        for job in jobs:
+            if job.url in artwork:
+                job.album_art = artwork[job.url]
+
+
+def cover_path(track_path):
+    return os.path.splitext(track_path)[0] + '_cover.jpg'
+
+
+def transcode(job):
+    """Download artwork and run processor.sh for one track, skipping finished work"""
+    track_path = job.path
+
+    if already_transcoded(track_path):
+        return {'path': track_path, 'url': job.url, 'skipped': True}
+
+    art_file = cover_path(track_path)
+    album_art = job.album_art
+    if album_art and album_art != 'null' and not os.path.exists(art_file):
+        try:
+            response = requests.get(album_art, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 200 and response.content:
+                with open(art_file, 'wb') as f:
+                    f.write(response.content)
+        except requests.RequestException:
+            # processor.sh converts without artwork when the file is missing
+            pass
+
+    result = subprocess.run(
+        [os.path.join(SCRIPT_DIR, 'processor.sh'), track_path, art_file, job.service or ''],
+        capture_output=True, text=True
+    )
+
+    if os.path.exists(art_file) and os.environ.get('KEEP_ARTWORK') != 'true':
+        os.remove(art_file)
+
+    if result.returncode != 0:
+        return {'path': track_path, 'url': job.url, 'error': result.stderr.strip()[-500:]}
+
+    output = [line for line in result.stdout.splitlines() if line.startswith('{')]
+    final_path = json.loads(output[-1])['path'] if output else aiff_path(track_path)
+    return {'path': final_path, 'url': job.url}
+
+
+def is_fifo(stream):
+    try:
+        return stat.S_ISFIFO(os.fstat(stream.fileno()).st_mode)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return False
+
+
+def fifo_lines(stream):
+    """Lines of a FIFO with as little as possible buffered on the way
+
+    A default 64 KB pipe plus Python's read buffer hold hundreds of jobs,
+    letting downloads run far ahead of busy workers. The pipe is shrunk to a
+    page and read without a buffer; a job every few seconds at most makes
+    reading a byte at a time cheap enough.
+    """
+    fd = stream.fileno()
+    try:
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+    except (AttributeError, OSError) as e:
+        logging.warning(f"Could not shrink the job pipe: {e}")
+
+    with io.FileIO(fd, 'r', closefd=False) as raw:
+        for line in raw:
+            yield line.decode('utf-8', errors='replace')
+
+
+def read_jobs(stream, jobs):
+    """Feed track records from stream into the jobs queue, None marks the end"""
+    for record in iter_records(stream):
+        if record.path:
+            jobs.put(record)
+    jobs.put(None)
+
+
+def next_batch(jobs, batch_size):
+    """Block for one job, then gather whatever else arrives shortly after"""
+    batch = []
+    job = jobs.get()
+    while job is not None:
+        batch.append(job)
+        if len(batch) >= batch_size:
+            break
+        try:
+            job = jobs.get(timeout=BATCH_WAIT_SECONDS)
+        except queue.Empty:
+            break
+    return batch, job is None
+
+
+def run_pool(stream, workers, batch_size=SPOTIFY_BATCH_SIZE):
+    """Transcode jobs from stream until it closes, keeping at most workers in flight
+
+    At most batch_size jobs wait in the queue and another batch_size in the
+    batch being submitted, beyond that the reader stops taking jobs from stream.
+    """
+    jobs = queue.Queue(maxsize=batch_size)
+    in_flight = threading.BoundedSemaphore(workers)
+    db_path = default_db_path()
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    reader = threading.Thread(target=read_jobs, args=(stream, jobs), daemon=True)
+    reader.start()
+
+    def on_done(future):
+        in_flight.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Transcode worker crashed: {e}")
+            result = {'error': str(e)}
+
+        with lock:
+            if result.get('skipped'):
+                counts['skipped'] += 1
+                logging.info(f"Already transcoded, skipping: {result['path']}")
+            elif result.get('error'):
+                counts['failed'] += 1
+                logging.error(f"Failed to transcode {result.get('path')}: {result['error']}")
+            else:
+                counts['done'] += 1
+                logging.info(f"Transcoded: {result['path']}")
+
+        if db_path and result.get('url') and not result.get('error'):
+            # Callbacks run on the executor's thread, which can't share a sqlite connection
+            job_queue = JobQueue(db_path)
+            job_queue.finish(result['url'])
+            job_queue.close()
+
+    logging.info(f"Transcode pool started with {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        finished = False
+        while not finished:
+            batch, finished = next_batch(jobs, batch_size)
+            if not batch:
+                continue
+
+            pending = [job for job in batch if not already_transcoded(job.path)]
+            try:
+                fill_artwork(pending)
+            except Exception as e:
+                # Never let artwork take the pool down, the writer would block on us forever
+                logging.error(f"Artwork lookup failed, transcoding without it: {e}")
+
+            for job in batch:
+                # Blocks once the pool is saturated, which in turn stops the reader
+                # and the downloads writing to us
+                in_flight.acquire()
+                executor.submit(transcode, job).add_done_callback(on_done)
+
+    logging.info(f"Transcode pool finished: {counts['done']} transcoded, "
+                 f"{counts['skipped']} skipped, {counts['failed']} failed")
+    return 1 if counts['failed'] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert downloaded tracks to AIFF with artwork in a process pool")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of parallel transcodes (default: number of CPU cores)")
+    parser.add_argument('jobs_file', nargs='?',
+                        help="JSON lines with path, service, url and optional album_art (default: stdin)")
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    if args.jobs_file:
+        with open(args.jobs_file, 'r') as stream:
+            return run_pool(stream, workers)
+
+    if is_fifo(sys.stdin):
+        # Fed by downloads as they finish: hold no more than about one job per
+        # worker, so a busy pool blocks the writer soon and holds back downloads
+        return run_pool(fifo_lines(sys.stdin), workers, batch_size=min(workers, SPOTIFY_BATCH_SIZE))
+    return run_pool(sys.stdin, workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())